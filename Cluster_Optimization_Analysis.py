@@ -51,6 +51,10 @@
 
 # COMMAND ----------
 
+# MAGIC %run ./Shared_Functions
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ---
 # MAGIC ## ⚙️ Configuration Widgets
@@ -63,19 +67,27 @@
 # MAGIC | **Workspace Filter** | Filter to a specific workspace or analyze all |
 # MAGIC | **Driver CPU/Memory Threshold** | Flag drivers exceeding these specs as "oversized" |
 # MAGIC | **VM Generation Thresholds** | Minimum acceptable VM generation per series (D, E, F, L, M, N) |
+# MAGIC | **Only Clusters With Cost** | Hide clusters without billing usage in the lookback period from the cluster-level reports |
 # MAGIC | **Output Catalog/Schema** | Location to save analysis results (for historical tracking) |
+# MAGIC | **Save Results** | Append the cluster-level findings to Delta tables in the output location |
+# MAGIC | **Use Cache Tables** | Keep the workspace list and daily per-cluster costs in cache tables in the output location, so later runs only aggregate new billing data |
+# MAGIC 
+# MAGIC > **Note**: The notebook only writes to the output location when **Save Results** or **Use Cache Tables** is `Yes`. With **Use Cache Tables**, the workspace list for the dropdown is cached in `<output_catalog>.<output_schema>.workspace_ids_cache` and refreshed once a day, and costs are kept in `cluster_cost_daily` (see Shared Data). Without write access to the output location, the system tables are read directly.
 
 # COMMAND ----------
 
+# Output location for saving results (created first - it also holds the workspace ID cache)
+dbutils.widgets.text("output_catalog", "dbdemos_steventan", "Output Catalog")
+dbutils.widgets.text("output_schema", "waf", "Output Schema")
+dbutils.widgets.dropdown("save_results", "No", ["No", "Yes"], "Save Results to Output Tables")
+dbutils.widgets.dropdown("use_cache_tables", "No", ["No", "Yes"], "Use Cache Tables in Output Location")
+
 # First, get available workspace IDs for the dropdown
 try:
-    workspace_ids_df = spark.sql("""
-        SELECT DISTINCT workspace_id 
-        FROM system.compute.clusters 
-        WHERE workspace_id IS NOT NULL 
-        ORDER BY workspace_id
-    """)
-    available_workspaces = [row.workspace_id for row in workspace_ids_df.collect()]
+    available_workspaces = load_workspace_ids(
+        f"{dbutils.widgets.get('output_catalog')}.{dbutils.widgets.get('output_schema')}",
+        dbutils.widgets.get("use_cache_tables") == "Yes",
+    )
     workspace_options = ["ALL"] + available_workspaces
 except:
     workspace_options = ["ALL"]
@@ -87,10 +99,6 @@ dbutils.widgets.dropdown("driver_cpu_threshold", "16", ["8", "16", "32", "48", "
 dbutils.widgets.dropdown("driver_memory_gb_threshold", "64", ["32", "64", "128", "256"], "Max Recommended Driver Memory (GB)")
 dbutils.widgets.combobox("workspace_filter", "ALL", workspace_options, "Workspace ID Filter")
 
-# Output location for saving results
-dbutils.widgets.text("output_catalog", "dbdemos_steventan", "Output Catalog")
-dbutils.widgets.text("output_schema", "waf", "Output Schema")
-
 # VM Generation Thresholds by Series (minimum recommended generation)
 dbutils.widgets.dropdown("vm_threshold_D", "5", ["3", "4", "5", "6"], "D-Series Min Gen (General Purpose)")
 dbutils.widgets.dropdown("vm_threshold_E", "5", ["3", "4", "5", "6"], "E-Series Min Gen (Memory Optimized)")
@@ -100,19 +108,29 @@ dbutils.widgets.dropdown("vm_threshold_M", "2", ["1", "2"], "M-Series Min Gen (L
 dbutils.widgets.dropdown("vm_threshold_N", "1", ["1", "2"], "N-Series Min Gen (GPU)")
 dbutils.widgets.dropdown("vm_threshold_default", "5", ["3", "4", "5", "6"], "Default Min Gen (Other Series)")
 
+# Cluster-level reports: hide clusters without billing usage in the lookback period
+dbutils.widgets.dropdown("only_clusters_with_cost", "No", ["No", "Yes"], "Only Clusters With Cost")
+
 # COMMAND ----------
 
 # Get widget values
 lookback_days = int(dbutils.widgets.get("lookback_days"))
+# First day of the lookback period, computed once so every query filters on the same constant date
+lookback_start_date = date.today() - timedelta(days=lookback_days)
 latest_lts_version = dbutils.widgets.get("latest_lts_version")
 driver_cpu_threshold = int(dbutils.widgets.get("driver_cpu_threshold"))
 driver_memory_gb_threshold = int(dbutils.widgets.get("driver_memory_gb_threshold"))
-workspace_filter = dbutils.widgets.get("workspace_filter")
+workspace_filter = dbutils.widgets.get("workspace_filter").strip()
+# The combobox accepts free text; workspace IDs are numeric, so reject anything else before it reaches a query
+if workspace_filter != "ALL" and not workspace_filter.isdigit():
+    raise ValueError(f"Invalid Workspace ID Filter '{workspace_filter}' - choose ALL or a numeric workspace ID")
 
 # Output location
 output_catalog = dbutils.widgets.get("output_catalog")
 output_schema = dbutils.widgets.get("output_schema")
 output_location = f"{output_catalog}.{output_schema}"
+save_results = dbutils.widgets.get("save_results") == "Yes"
+use_cache_tables = dbutils.widgets.get("use_cache_tables") == "Yes"
 
 # VM Generation Thresholds by Series
 vm_threshold_D = int(dbutils.widgets.get("vm_threshold_D"))
@@ -123,34 +141,126 @@ vm_threshold_M = int(dbutils.widgets.get("vm_threshold_M"))
 vm_threshold_N = int(dbutils.widgets.get("vm_threshold_N"))
 vm_threshold_default = int(dbutils.widgets.get("vm_threshold_default"))
 
-# Build workspace filter clause
-if workspace_filter == "ALL":
-    workspace_clause = "1=1"  # No filter
-else:
-    workspace_clause = f"workspace_id = '{workspace_filter}'"
-
-print(f"""
-╔══════════════════════════════════════════════════════════════════════╗
-║                       CONFIGURATION SUMMARY                           ║
-╠══════════════════════════════════════════════════════════════════════╣
-║  Lookback Period:           {lookback_days:>5} days                                    ║
-║  Latest LTS Version:        {latest_lts_version:>10}                                     ║
-║  Max Driver vCPUs:          {driver_cpu_threshold:>5}                                          ║
-║  Max Driver Memory (GB):    {driver_memory_gb_threshold:>5}                                          ║
-║  Workspace Filter:          {workspace_filter:<20}                         ║
-║  Output Location:           {output_location:<30}               ║
-╠══════════════════════════════════════════════════════════════════════╣
-║                    VM GENERATION THRESHOLDS BY SERIES                 ║
-╠══════════════════════════════════════════════════════════════════════╣
-║  D-Series (General Purpose):      v{vm_threshold_D}+                                   ║
-║  E-Series (Memory Optimized):     v{vm_threshold_E}+                                   ║
-║  F-Series (Compute Optimized):    v{vm_threshold_F}+                                   ║
-║  L-Series (Storage Optimized):    v{vm_threshold_L}+                                   ║
-║  M-Series (Large Memory):         v{vm_threshold_M}+                                   ║
-║  N-Series (GPU):                  v{vm_threshold_N}+                                   ║
-║  Other Series (Default):          v{vm_threshold_default}+                                   ║
-╚══════════════════════════════════════════════════════════════════════╝
-""")
+# Cluster-level reports inner-join costs when zero-cost clusters are hidden (distribution summaries always keep them)
+only_clusters_with_cost = dbutils.widgets.get("only_clusters_with_cost") == "Yes"
+cluster_cost_join = "JOIN" if only_clusters_with_cost else "LEFT JOIN"
+
+# Named parameters bound into the analysis queries (referenced as :name in the SQL)
+query_params = {
+    "lookback_start_date": lookback_start_date,
+    "vm_threshold_default": vm_threshold_default,
+    "driver_cpu_threshold": driver_cpu_threshold,
+    "driver_memory_gb_threshold": driver_memory_gb_threshold,
+}
+
+# Configuration summary
+config_settings = [
+    ("Lookback Period (Days)", lookback_days),
+    ("Lookback Start Date", lookback_start_date),
+    ("Latest LTS Version", latest_lts_version),
+    ("Max Driver vCPUs", driver_cpu_threshold),
+    ("Max Driver Memory (GB)", driver_memory_gb_threshold),
+    ("Workspace Filter", workspace_filter),
+    ("Output Location", output_location),
+    ("Save Results", "Yes" if save_results else "No"),
+    ("Use Cache Tables", "Yes" if use_cache_tables else "No"),
+    ("Only Clusters With Cost", "Yes" if only_clusters_with_cost else "No"),
+    ("D-Series Min Gen (General Purpose)", f"v{vm_threshold_D}+"),
+    ("E-Series Min Gen (Memory Optimized)", f"v{vm_threshold_E}+"),
+    ("F-Series Min Gen (Compute Optimized)", f"v{vm_threshold_F}+"),
+    ("L-Series Min Gen (Storage Optimized)", f"v{vm_threshold_L}+"),
+    ("M-Series Min Gen (Large Memory)", f"v{vm_threshold_M}+"),
+    ("N-Series Min Gen (GPU)", f"v{vm_threshold_N}+"),
+    ("Other Series Min Gen (Default)", f"v{vm_threshold_default}+"),
+]
+config_df = spark.createDataFrame([(setting, str(value)) for setting, value in config_settings], ["Setting", "Value"])
+display(config_df)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ---
+# MAGIC ## 🧮 Shared Data
+# MAGIC 
+# MAGIC Every section below works on the same set of clusters and the same cost figures. The cells below compute these **once**, cache them, and register them as temp views so the system tables are only scanned a single time per run:
+# MAGIC 
+# MAGIC | Temp View | Contents |
+# MAGIC |-----------|----------|
+# MAGIC | `active_clusters` | Clusters active in the lookback period (after workspace filter), projected to the columns the sections use, with DBR version, VM series and VM generation pre-extracted and driver/worker vCPUs and memory joined from `system.compute.node_types` |
+# MAGIC | `cluster_costs` | DBU consumption and list-price cost per cluster over the lookback period |
+# MAGIC 
+# MAGIC With **Use Cache Tables** set to `Yes`, `cluster_costs` is summed from `<output_catalog>.<output_schema>.cluster_cost_daily`, a Delta table of daily DBUs and cost per cluster. Each run only re-aggregates billing data since the last refresh (plus a few days for late-arriving records), instead of rescanning the whole lookback period. Otherwise, or without write access to the output location, the billing tables are aggregated directly over the lookback period.
+# MAGIC 
+# MAGIC The section queries are independent of each other, so each one is **submitted to a thread pool** as soon as it is defined and runs in the background while the notebook continues. All results are displayed together in the **📋 Analysis Results** section.
+
+# COMMAND ----------
+
+# Cache table of daily DBUs and cost per cluster (see load_cluster_costs in Shared_Functions)
+cluster_cost_daily_table = f"{output_location}.cluster_cost_daily"
+
+# Per-cluster DBUs and cost over the lookback period (shared by all sections)
+cluster_costs_df = load_cluster_costs(cluster_cost_daily_table, lookback_start_date, use_cache_tables)
+cache_df(cluster_costs_df).createOrReplaceTempView("cluster_costs")
+
+print("✅ Created cached temp view: cluster_costs")
+
+# COMMAND ----------
+
+# Active clusters in the lookback period with DBR version, VM series/generation and node hardware resolved once
+active_clusters_df = spark.sql("""
+    SELECT /*+ BROADCAST(dnt, wnt) */
+        -- Only the columns the sections use, so the cache and downstream joins stay narrow
+        c.account_id,
+        c.workspace_id,
+        c.cluster_id,
+        c.cluster_name,
+        c.owned_by,
+        c.dbr_version,
+        c.driver_node_type,
+        c.worker_node_type,
+        c.worker_count,
+        c.cluster_source,
+        REGEXP_EXTRACT(c.dbr_version, '([0-9]+\\.[0-9]+)', 1) AS dbr_major_minor,
+        -- Extract VM series (D, E, F, L, M, N, etc.)
+        REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) AS driver_series,
+        REGEXP_EXTRACT(c.worker_node_type, 'Standard_([A-Z]+)', 1) AS worker_series,
+        -- Series family letter, the key of the vm_thresholds lookup
+        REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z])', 1) AS driver_series_prefix,
+        REGEXP_EXTRACT(c.worker_node_type, 'Standard_([A-Z])', 1) AS worker_series_prefix,
+        -- Extract VM generation
+        TRY_CAST(REGEXP_EXTRACT(c.driver_node_type, '_v([0-9]+)', 1) AS INT) AS driver_gen,
+        TRY_CAST(REGEXP_EXTRACT(c.worker_node_type, '_v([0-9]+)', 1) AS INT) AS worker_gen,
+        -- Node hardware specs, so the VM and driver sections need no node_types joins
+        dnt.core_count AS driver_cores,
+        dnt.memory_mb AS driver_memory_mb,
+        wnt.core_count AS worker_cores,
+        wnt.memory_mb AS worker_memory_mb
+    FROM system.compute.clusters c
+    LEFT JOIN system.compute.node_types dnt 
+        ON c.driver_node_type = dnt.node_type
+    LEFT JOIN system.compute.node_types wnt 
+        ON c.worker_node_type = wnt.node_type
+    WHERE c.delete_time IS NULL
+        AND c.change_time >= :lookback_start_date
+""", args=query_params)
+
+# Workspace filter is bound as a literal value (never spliced into the SQL text); Spark pushes it down into the scan
+if workspace_filter != "ALL":
+    active_clusters_df = active_clusters_df.where(F.col("workspace_id") == F.lit(workspace_filter))
+cache_df(active_clusters_df).createOrReplaceTempView("active_clusters")
+
+print("✅ Created cached temp view: active_clusters")
+
+
+# COMMAND ----------
+
+# Materialize the shared caches first so the concurrent queries don't each compute them
+if not is_serverless:
+    cluster_costs_df.count()
+    active_clusters_df.count()
+
+# Thread pool for the section queries - they share the cached views above but not each other's results
+sections = SectionQueries(query_params, max_workers=6)
 
 # COMMAND ----------
 
@@ -179,13 +289,12 @@ print(f"""
 # MAGIC %md
 # MAGIC ### 📅 DBR LTS Support Reference
 # MAGIC 
-# MAGIC The cell below creates a reference table (`dbr_lts_support`) containing official end-of-support dates for each LTS version. This is used to calculate how many days remain until each version expires.
+# MAGIC The cell below displays the official end-of-support dates for each LTS version and how many days remain until each version expires. The same schedule is folded into the DBR queries as `CASE` expressions, so they need no join against a reference table.
 
 # COMMAND ----------
 
 # DBR LTS End-of-Support Reference Table
-from datetime import datetime, date
-from pyspark.sql.types import StructType, StructField, StringType, DateType
+from pyspark.sql.types import StructType, StructField, StringType
 
 # Official DBR LTS Support Schedule
 dbr_lts_support = [
@@ -197,7 +306,7 @@ dbr_lts_support = [
     ("12.2", "2023-03-01", "2026-03-01", "3.3.2"),
 ]
 
-# Create DataFrame and register as temp view
+# Create DataFrame for display
 schema = StructType([
     StructField("lts_version", StringType(), False),
     StructField("release_date", StringType(), False),
@@ -205,37 +314,27 @@ schema = StructType([
     StructField("spark_version", StringType(), False),
 ])
 
-dbr_support_df = spark.createDataFrame(dbr_lts_support, schema)
-dbr_support_df.createOrReplaceTempView("dbr_lts_support")
-
-# Display the reference table with days remaining
-today = date.today()
-
-print("╔══════════════════════════════════════════════════════════════════════════════════╗")
-print("║                        DBR LTS END-OF-SUPPORT REFERENCE                           ║")
-print("╠═══════════╦════════════════╦═══════════════════╦════════════════╦═════════════════╣")
-print("║  Version  ║  Release Date  ║  End-of-Support   ║  Days Left     ║  Status         ║")
-print("╠═══════════╬════════════════╬═══════════════════╬════════════════╬═════════════════╣")
+# Days remaining and support status are computed in Spark rather than in a Python loop
+dbr_support_df = (
+    spark.createDataFrame(dbr_lts_support, schema)
+    .withColumn("days_left", F.datediff(F.to_date("end_of_support"), F.current_date()))
+    .withColumn("status", F.expr("""
+        CASE 
+            WHEN days_left < 0 THEN '⛔ EXPIRED'
+            WHEN days_left < 180 THEN '🔴 CRITICAL'
+            WHEN days_left < 365 THEN '🟠 WARNING'
+            ELSE '🟢 SUPPORTED'
+        END
+    """))
+)
 
-for row in dbr_lts_support:
-    version, release_date, end_of_support, spark_ver = row
-    eos_date = datetime.strptime(end_of_support, "%Y-%m-%d").date()
-    days_left = (eos_date - today).days
-    
-    if days_left < 0:
-        status = "⛔ EXPIRED"
-    elif days_left < 180:  # Less than 6 months
-        status = "🔴 CRITICAL"
-    elif days_left < 365:  # Less than 1 year
-        status = "🟠 WARNING"
-    else:
-        status = "🟢 SUPPORTED"
-    
-    print(f"║  {version:>7} ║  {release_date:^12}  ║  {end_of_support:^15}  ║  {days_left:>10} d  ║  {status:<14} ║")
+# The schedule is known up front, so the queries look versions up with CASE expressions instead of joining a 6-row table
+lts_version_sql = "CASE WHEN dbr_major_minor IN (" + ", ".join(f"'{version}'" for version, _, _, _ in dbr_lts_support) + ") THEN dbr_major_minor END"
+end_of_support_sql = "CASE dbr_major_minor " + " ".join(f"WHEN '{version}' THEN DATE'{eos}'" for version, _, eos, _ in dbr_lts_support) + " END"
+days_until_eos_sql = f"DATEDIFF({end_of_support_sql}, current_date())"
 
-print("╚═══════════╩════════════════╩═══════════════════╩════════════════╩═════════════════╝")
-print("\n🔴 CRITICAL: < 6 months to end-of-support | 🟠 WARNING: < 1 year | 🟢 SUPPORTED: > 1 year")
-print("\n✅ Created temp view: dbr_lts_support")
+print("🔴 CRITICAL: < 6 months to end-of-support | 🟠 WARNING: < 1 year | 🟢 SUPPORTED: > 1 year")
+display(dbr_support_df.select("lts_version", "release_date", "end_of_support", "days_left", "status"))
 
 # COMMAND ----------
 
@@ -254,38 +353,13 @@ print("\n✅ Created temp view: dbr_lts_support")
 
 # Find clusters with outdated DBR versions - with cost data (DBUs and $)
 outdated_dbr_query = f"""
-WITH cluster_dbr AS (
-    SELECT 
-        c.*,
-        REGEXP_EXTRACT(c.dbr_version, '([0-9]+\\.[0-9]+)', 1) AS dbr_major_minor
-    FROM system.compute.clusters c
-    WHERE c.delete_time IS NULL
-        AND c.change_time >= date_sub(current_date(), {lookback_days})
-        AND {workspace_clause}
-),
-cluster_with_support AS (
+WITH cluster_with_support AS (
     SELECT 
         cd.*,
-        s.lts_version,
-        s.end_of_support,
-        DATEDIFF(DATE(s.end_of_support), current_date()) AS days_until_eos
-    FROM cluster_dbr cd
-    LEFT JOIN dbr_lts_support s 
-        ON cd.dbr_major_minor = s.lts_version
-),
-cluster_costs AS (
-    SELECT 
-        u.usage_metadata.cluster_id,
-        ROUND(SUM(u.usage_quantity), 2) AS total_dbus,
-        ROUND(SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)), 2) AS total_cost_usd
-    FROM system.billing.usage u
-    LEFT JOIN system.billing.list_prices lp 
-        ON u.sku_name = lp.sku_name
-        AND u.usage_start_time >= lp.price_start_time
-        AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-    WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-        AND u.usage_metadata.cluster_id IS NOT NULL
-    GROUP BY u.usage_metadata.cluster_id
+        {lts_version_sql} AS lts_version,
+        {end_of_support_sql} AS end_of_support,
+        {days_until_eos_sql} AS days_until_eos
+    FROM active_clusters cd
 )
 SELECT 
     cws.account_id,
@@ -308,10 +382,10 @@ SELECT
     cws.driver_node_type,
     cws.worker_node_type,
     cws.cluster_source,
-    COALESCE(cc.total_dbus, 0) AS total_dbus,
-    COALESCE(cc.total_cost_usd, 0) AS total_cost_usd
+    ROUND(COALESCE(cc.total_dbus, 0), 2) AS total_dbus,
+    ROUND(COALESCE(cc.total_cost_usd, 0), 2) AS total_cost_usd
 FROM cluster_with_support cws
-LEFT JOIN cluster_costs cc ON cws.cluster_id = cc.cluster_id
+{cluster_cost_join} cluster_costs cc ON cws.cluster_id = cc.cluster_id
 ORDER BY 
     CASE 
         WHEN cws.lts_version IS NULL THEN -1
@@ -320,7 +394,7 @@ ORDER BY
     END ASC,
     cc.total_cost_usd DESC NULLS LAST
 """
-display(spark.sql(outdated_dbr_query))
+sections.submit("outdated_dbr", outdated_dbr_query)
 
 # COMMAND ----------
 
@@ -336,43 +410,22 @@ display(spark.sql(outdated_dbr_query))
 
 # DBR Version Distribution Summary with Cost Impact
 dbr_distribution_query = f"""
-WITH cluster_dbr AS (
-    SELECT 
-        c.cluster_id,
-        c.workspace_id,
-        c.dbr_version,
-        REGEXP_EXTRACT(c.dbr_version, '([0-9]+\\.[0-9]+)', 1) AS dbr_major_minor
-    FROM system.compute.clusters c
-    WHERE c.delete_time IS NULL
-        AND c.change_time >= date_sub(current_date(), {lookback_days})
-        AND {workspace_clause}
-),
-cluster_with_support AS (
+WITH cluster_with_support AS (
     SELECT 
         cd.cluster_id,
         cd.workspace_id,
         cd.dbr_version,
-        COALESCE(s.lts_version, cd.dbr_major_minor) AS dbr_family,
-        s.end_of_support,
-        DATEDIFF(DATE(s.end_of_support), current_date()) AS days_remaining
-    FROM cluster_dbr cd
-    LEFT JOIN dbr_lts_support s ON cd.dbr_major_minor = s.lts_version
+        COALESCE({lts_version_sql}, cd.dbr_major_minor) AS dbr_family,
+        {end_of_support_sql} AS end_of_support,
+        {days_until_eos_sql} AS days_remaining
+    FROM active_clusters cd
 ),
-cluster_costs AS (
-    SELECT 
-        u.usage_metadata.cluster_id,
-        SUM(u.usage_quantity) AS total_dbus,
-        SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)) AS total_cost_usd
-    FROM system.billing.usage u
-    LEFT JOIN system.billing.list_prices lp 
-        ON u.sku_name = lp.sku_name
-        AND u.usage_start_time >= lp.price_start_time
-        AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-    WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-        AND u.usage_metadata.cluster_id IS NOT NULL
-    GROUP BY u.usage_metadata.cluster_id
+grand_total AS (
+    SELECT COALESCE(SUM(cc.total_cost_usd), 0) AS total_cost_usd
+    FROM cluster_with_support cws
+    LEFT JOIN cluster_costs cc ON cws.cluster_id = cc.cluster_id
 )
-SELECT 
+SELECT /*+ BROADCAST(gt) */
     CONCAT('DBR ', cws.dbr_family) AS dbr_version,
     CASE WHEN cws.end_of_support IS NULL THEN 'Non-LTS (Short Support)' ELSE CAST(DATE(cws.end_of_support) AS STRING) END AS end_of_support_date,
     COALESCE(cws.days_remaining, 0) AS days_remaining,
@@ -384,16 +437,17 @@ SELECT
         ELSE '🟢 SUPPORTED'
     END AS status,
     COUNT(DISTINCT cws.cluster_id) AS cluster_count,
-    ROUND(SUM(COALESCE(cc.total_dbus, 0)), 2) AS total_dbus,
-    ROUND(SUM(COALESCE(cc.total_cost_usd, 0)), 2) AS total_cost_usd,
-    ROUND(SUM(COALESCE(cc.total_cost_usd, 0)) * 100.0 / NULLIF(SUM(SUM(COALESCE(cc.total_cost_usd, 0))) OVER (), 0), 2) AS pct_of_total_cost
+    ROUND(COALESCE(SUM(cc.total_dbus), 0), 2) AS total_dbus,
+    ROUND(COALESCE(SUM(cc.total_cost_usd), 0), 2) AS total_cost_usd,
+    ROUND(COALESCE(SUM(cc.total_cost_usd), 0) * 100.0 / NULLIF(gt.total_cost_usd, 0), 2) AS pct_of_total_cost
 FROM cluster_with_support cws
 LEFT JOIN cluster_costs cc ON cws.cluster_id = cc.cluster_id
-GROUP BY cws.dbr_family, cws.end_of_support, cws.days_remaining
+CROSS JOIN grand_total gt
+GROUP BY cws.dbr_family, cws.end_of_support, cws.days_remaining, gt.total_cost_usd
 ORDER BY 
     CASE WHEN cws.end_of_support IS NULL THEN -1 ELSE COALESCE(cws.days_remaining, 9999) END ASC
 """
-display(spark.sql(dbr_distribution_query))
+sections.submit("dbr_distribution", dbr_distribution_query, small_result=True)
 
 # COMMAND ----------
 
@@ -414,6 +468,24 @@ display(spark.sql(dbr_distribution_query))
 
 # COMMAND ----------
 
+# VM Generation Thresholds Reference Table (series prefix -> minimum recommended generation)
+# Series without an entry fall back to vm_threshold_default
+vm_thresholds = [
+    ("D", vm_threshold_D),
+    ("E", vm_threshold_E),
+    ("F", vm_threshold_F),
+    ("L", vm_threshold_L),
+    ("M", vm_threshold_M),
+    ("N", vm_threshold_N),
+]
+
+vm_thresholds_df = spark.createDataFrame(vm_thresholds, ["series_prefix", "min_gen"])
+cache_df(vm_thresholds_df).createOrReplaceTempView("vm_thresholds")
+
+print("✅ Created temp view: vm_thresholds")
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ### 🔎 Cluster-Level VM Generation Analysis
 # MAGIC 
@@ -430,58 +502,20 @@ display(spark.sql(dbr_distribution_query))
 
 # Find clusters with older VM generations - with cost data (using series-specific thresholds)
 old_vm_query = f"""
-WITH cluster_costs AS (
-    SELECT 
-        u.usage_metadata.cluster_id,
-        ROUND(SUM(u.usage_quantity), 2) AS total_dbus,
-        ROUND(SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)), 2) AS total_cost_usd
-    FROM system.billing.usage u
-    LEFT JOIN system.billing.list_prices lp 
-        ON u.sku_name = lp.sku_name
-        AND u.usage_start_time >= lp.price_start_time
-        AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-    WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-        AND u.usage_metadata.cluster_id IS NOT NULL
-    GROUP BY u.usage_metadata.cluster_id
-),
-clusters_with_vm_info AS (
-    SELECT 
-        c.*,
-        -- Extract VM series (D, E, F, L, M, N, etc.)
-        REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) AS driver_series,
-        REGEXP_EXTRACT(c.worker_node_type, 'Standard_([A-Z]+)', 1) AS worker_series,
-        -- Extract VM generation
-        TRY_CAST(REGEXP_EXTRACT(c.driver_node_type, '_v([0-9]+)', 1) AS INT) AS driver_gen,
-        TRY_CAST(REGEXP_EXTRACT(c.worker_node_type, '_v([0-9]+)', 1) AS INT) AS worker_gen
-    FROM system.compute.clusters c
-    WHERE c.delete_time IS NULL
-        AND c.change_time >= date_sub(current_date(), {lookback_days})
-        AND {workspace_clause}
-),
-clusters_with_thresholds AS (
-    SELECT 
+WITH clusters_with_thresholds AS (
+    SELECT /*+ BROADCAST(t_driver, t_worker) */
         cv.*,
-        -- Get threshold based on driver series
-        CASE 
-            WHEN cv.driver_series LIKE 'D%' THEN {vm_threshold_D}
-            WHEN cv.driver_series LIKE 'E%' THEN {vm_threshold_E}
-            WHEN cv.driver_series LIKE 'F%' THEN {vm_threshold_F}
-            WHEN cv.driver_series LIKE 'L%' THEN {vm_threshold_L}
-            WHEN cv.driver_series LIKE 'M%' THEN {vm_threshold_M}
-            WHEN cv.driver_series LIKE 'N%' THEN {vm_threshold_N}
-            ELSE {vm_threshold_default}
-        END AS driver_threshold,
-        -- Get threshold based on worker series
-        CASE 
-            WHEN cv.worker_series LIKE 'D%' THEN {vm_threshold_D}
-            WHEN cv.worker_series LIKE 'E%' THEN {vm_threshold_E}
-            WHEN cv.worker_series LIKE 'F%' THEN {vm_threshold_F}
-            WHEN cv.worker_series LIKE 'L%' THEN {vm_threshold_L}
-            WHEN cv.worker_series LIKE 'M%' THEN {vm_threshold_M}
-            WHEN cv.worker_series LIKE 'N%' THEN {vm_threshold_N}
-            ELSE {vm_threshold_default}
-        END AS worker_threshold
-    FROM clusters_with_vm_info cv
+        -- Get threshold based on driver/worker series (first letter of the series)
+        COALESCE(t_driver.min_gen, :vm_threshold_default) AS driver_threshold,
+        COALESCE(t_worker.min_gen, :vm_threshold_default) AS worker_threshold
+    FROM active_clusters cv
+    LEFT JOIN vm_thresholds t_driver 
+        ON cv.driver_series_prefix = t_driver.series_prefix
+    LEFT JOIN vm_thresholds t_worker 
+        ON cv.worker_series_prefix = t_worker.series_prefix
+    -- Keep only offending clusters before joining node types and costs
+    WHERE COALESCE(cv.driver_gen, 99) < COALESCE(t_driver.min_gen, :vm_threshold_default)
+       OR COALESCE(cv.worker_gen, 99) < COALESCE(t_worker.min_gen, :vm_threshold_default)
 )
 SELECT 
     ct.account_id,
@@ -503,27 +537,21 @@ SELECT
         THEN '🔴 Below Recommended'
         ELSE '🟢 Meets Threshold'
     END AS vm_status,
-    nt_driver.core_count AS driver_cores,
-    ROUND(nt_driver.memory_mb / 1024, 1) AS driver_memory_gb,
-    nt_worker.core_count AS worker_cores,
-    ROUND(nt_worker.memory_mb / 1024, 1) AS worker_memory_gb,
+    ct.driver_cores,
+    ROUND(ct.driver_memory_mb / 1024, 1) AS driver_memory_gb,
+    ct.worker_cores,
+    ROUND(ct.worker_memory_mb / 1024, 1) AS worker_memory_gb,
     ct.dbr_version,
     ct.cluster_source,
-    COALESCE(cc.total_dbus, 0) AS total_dbus,
-    COALESCE(cc.total_cost_usd, 0) AS total_cost_usd
+    ROUND(COALESCE(cc.total_dbus, 0), 2) AS total_dbus,
+    ROUND(COALESCE(cc.total_cost_usd, 0), 2) AS total_cost_usd
 FROM clusters_with_thresholds ct
-LEFT JOIN system.compute.node_types nt_driver 
-    ON ct.driver_node_type = nt_driver.node_type
-LEFT JOIN system.compute.node_types nt_worker 
-    ON ct.worker_node_type = nt_worker.node_type
-LEFT JOIN cluster_costs cc ON ct.cluster_id = cc.cluster_id
-WHERE (COALESCE(ct.driver_gen, 99) < ct.driver_threshold 
-       OR COALESCE(ct.worker_gen, 99) < ct.worker_threshold)
+{cluster_cost_join} cluster_costs cc ON ct.cluster_id = cc.cluster_id
 ORDER BY 
     LEAST(COALESCE(ct.driver_gen, 99), COALESCE(ct.worker_gen, 99)),
     cc.total_cost_usd DESC NULLS LAST
 """
-display(spark.sql(old_vm_query))
+sections.submit("old_vm", old_vm_query)
 
 # COMMAND ----------
 
@@ -535,64 +563,45 @@ display(spark.sql(old_vm_query))
 # COMMAND ----------
 
 # VM Generation Distribution Summary by Series with Cost Impact
-vm_distribution_query = f"""
-WITH cluster_costs AS (
-    SELECT 
-        u.usage_metadata.cluster_id,
-        SUM(u.usage_quantity) AS total_dbus,
-        SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)) AS total_cost_usd
-    FROM system.billing.usage u
-    LEFT JOIN system.billing.list_prices lp 
-        ON u.sku_name = lp.sku_name
-        AND u.usage_start_time >= lp.price_start_time
-        AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-    WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-        AND u.usage_metadata.cluster_id IS NOT NULL
-    GROUP BY u.usage_metadata.cluster_id
-),
-clusters_with_vm_info AS (
-    SELECT 
+vm_distribution_query = """
+WITH clusters_with_vm_info AS (
+    SELECT /*+ BROADCAST(t) */
         c.cluster_id,
         c.driver_node_type,
-        -- Extract series (first letter(s) after Standard_)
-        REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) AS vm_series,
-        REGEXP_EXTRACT(c.driver_node_type, '_v([0-9]+)', 1) AS vm_gen_str,
-        TRY_CAST(REGEXP_EXTRACT(c.driver_node_type, '_v([0-9]+)', 1) AS INT) AS vm_gen_int,
+        -- Series and generation are pre-extracted in active_clusters
+        c.driver_series AS vm_series,
+        c.driver_gen AS vm_gen,
         -- Get threshold based on series
-        CASE 
-            WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'D%' THEN {vm_threshold_D}
-            WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'E%' THEN {vm_threshold_E}
-            WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'F%' THEN {vm_threshold_F}
-            WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'L%' THEN {vm_threshold_L}
-            WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'M%' THEN {vm_threshold_M}
-            WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'N%' THEN {vm_threshold_N}
-            ELSE {vm_threshold_default}
-        END AS min_threshold
-    FROM system.compute.clusters c
-    WHERE c.delete_time IS NULL
-        AND c.change_time >= date_sub(current_date(), {lookback_days})
-        AND {workspace_clause}
-        AND REGEXP_EXTRACT(c.driver_node_type, '_v([0-9]+)', 1) IS NOT NULL
-        AND REGEXP_EXTRACT(c.driver_node_type, '_v([0-9]+)', 1) != ''
+        COALESCE(t.min_gen, :vm_threshold_default) AS min_threshold
+    FROM active_clusters c
+    LEFT JOIN vm_thresholds t 
+        ON c.driver_series_prefix = t.series_prefix
+    WHERE c.driver_gen IS NOT NULL
+),
+grand_total AS (
+    SELECT COALESCE(SUM(cc.total_cost_usd), 0) AS total_cost_usd
+    FROM clusters_with_vm_info cwi
+    LEFT JOIN cluster_costs cc ON cwi.cluster_id = cc.cluster_id
 )
-SELECT 
+SELECT /*+ BROADCAST(gt) */
     cwi.vm_series AS series,
-    CONCAT('v', cwi.vm_gen_str) AS vm_generation,
+    CONCAT('v', cwi.vm_gen) AS vm_generation,
     CONCAT('v', cwi.min_threshold) AS min_recommended,
     COUNT(DISTINCT cwi.cluster_id) AS cluster_count,
     CASE 
-        WHEN cwi.vm_gen_int < cwi.min_threshold THEN '🔴 Below Threshold'
+        WHEN cwi.vm_gen < cwi.min_threshold THEN '🔴 Below Threshold'
         ELSE '🟢 Meets Threshold'
     END AS status,
-    ROUND(SUM(COALESCE(cc.total_dbus, 0)), 2) AS total_dbus,
-    ROUND(SUM(COALESCE(cc.total_cost_usd, 0)), 2) AS total_cost_usd,
-    ROUND(SUM(COALESCE(cc.total_cost_usd, 0)) * 100.0 / NULLIF(SUM(SUM(COALESCE(cc.total_cost_usd, 0))) OVER (), 0), 2) AS pct_of_total_cost
+    ROUND(COALESCE(SUM(cc.total_dbus), 0), 2) AS total_dbus,
+    ROUND(COALESCE(SUM(cc.total_cost_usd), 0), 2) AS total_cost_usd,
+    ROUND(COALESCE(SUM(cc.total_cost_usd), 0) * 100.0 / NULLIF(gt.total_cost_usd, 0), 2) AS pct_of_total_cost
 FROM clusters_with_vm_info cwi
 LEFT JOIN cluster_costs cc ON cwi.cluster_id = cc.cluster_id
-GROUP BY cwi.vm_series, cwi.vm_gen_str, cwi.vm_gen_int, cwi.min_threshold
-ORDER BY cwi.vm_series, cwi.vm_gen_int
+CROSS JOIN grand_total gt
+GROUP BY cwi.vm_series, cwi.vm_gen, cwi.min_threshold, gt.total_cost_usd
+ORDER BY cwi.vm_series, cwi.vm_gen
 """
-display(spark.sql(vm_distribution_query))
+sections.submit("vm_distribution", vm_distribution_query, small_result=True)
 
 # COMMAND ----------
 
@@ -624,20 +633,6 @@ display(spark.sql(vm_distribution_query))
 
 # Find clusters with oversized driver nodes - with cost data
 oversized_driver_query = f"""
-WITH cluster_costs AS (
-    SELECT 
-        u.usage_metadata.cluster_id,
-        ROUND(SUM(u.usage_quantity), 2) AS total_dbus,
-        ROUND(SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)), 2) AS total_cost_usd
-    FROM system.billing.usage u
-    LEFT JOIN system.billing.list_prices lp 
-        ON u.sku_name = lp.sku_name
-        AND u.usage_start_time >= lp.price_start_time
-        AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-    WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-        AND u.usage_metadata.cluster_id IS NOT NULL
-    GROUP BY u.usage_metadata.cluster_id
-)
 SELECT 
     c.account_id,
     c.workspace_id,
@@ -645,30 +640,25 @@ SELECT
     c.cluster_name,
     c.owned_by AS owner,
     c.driver_node_type,
-    nt.core_count AS driver_vcpus,
-    ROUND(nt.memory_mb / 1024, 1) AS driver_memory_gb,
+    c.driver_cores AS driver_vcpus,
+    ROUND(c.driver_memory_mb / 1024, 1) AS driver_memory_gb,
     CASE 
-        WHEN nt.core_count > {driver_cpu_threshold} THEN '🔴 vCPUs Too High'
-        WHEN nt.memory_mb / 1024 > {driver_memory_gb_threshold} THEN '🟠 Memory Too High'
+        WHEN c.driver_cores > :driver_cpu_threshold THEN '🔴 vCPUs Too High'
+        WHEN c.driver_memory_mb / 1024 > :driver_memory_gb_threshold THEN '🟠 Memory Too High'
         ELSE '🟢 Appropriately Sized'
     END AS sizing_status,
     c.worker_node_type,
     c.worker_count,
     c.dbr_version,
     c.cluster_source,
-    COALESCE(cc.total_dbus, 0) AS total_dbus,
-    COALESCE(cc.total_cost_usd, 0) AS total_cost_usd
-FROM system.compute.clusters c
-JOIN system.compute.node_types nt 
-    ON c.driver_node_type = nt.node_type
-LEFT JOIN cluster_costs cc ON c.cluster_id = cc.cluster_id
-WHERE c.delete_time IS NULL
-    AND c.change_time >= date_sub(current_date(), {lookback_days})
-    AND {workspace_clause}
-    AND (nt.core_count > {driver_cpu_threshold} OR nt.memory_mb / 1024 > {driver_memory_gb_threshold})
-ORDER BY cc.total_cost_usd DESC NULLS LAST, nt.core_count DESC, nt.memory_mb DESC
+    ROUND(COALESCE(cc.total_dbus, 0), 2) AS total_dbus,
+    ROUND(COALESCE(cc.total_cost_usd, 0), 2) AS total_cost_usd
+FROM active_clusters c
+{cluster_cost_join} cluster_costs cc ON c.cluster_id = cc.cluster_id
+WHERE (c.driver_cores > :driver_cpu_threshold OR c.driver_memory_mb / 1024 > :driver_memory_gb_threshold)
+ORDER BY cc.total_cost_usd DESC NULLS LAST, c.driver_cores DESC, c.driver_memory_mb DESC
 """
-display(spark.sql(oversized_driver_query))
+sections.submit("oversized_driver", oversized_driver_query)
 
 # COMMAND ----------
 
@@ -680,46 +670,79 @@ display(spark.sql(oversized_driver_query))
 # COMMAND ----------
 
 # Driver sizing summary with cost impact
-driver_sizing_summary_query = f"""
-WITH cluster_costs AS (
+driver_sizing_summary_query = """
+WITH oversized_drivers AS (
     SELECT 
-        u.usage_metadata.cluster_id,
-        SUM(u.usage_quantity) AS total_dbus,
-        SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)) AS total_cost_usd
-    FROM system.billing.usage u
-    LEFT JOIN system.billing.list_prices lp 
-        ON u.sku_name = lp.sku_name
-        AND u.usage_start_time >= lp.price_start_time
-        AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-    WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-        AND u.usage_metadata.cluster_id IS NOT NULL
-    GROUP BY u.usage_metadata.cluster_id
+        c.cluster_id,
+        c.driver_node_type,
+        c.driver_cores AS core_count,
+        c.driver_memory_mb AS memory_mb
+    FROM active_clusters c
+    WHERE (c.driver_cores > :driver_cpu_threshold OR c.driver_memory_mb / 1024 > :driver_memory_gb_threshold)
+),
+grand_total AS (
+    SELECT COALESCE(SUM(cc.total_cost_usd), 0) AS total_cost_usd
+    FROM oversized_drivers c
+    LEFT JOIN cluster_costs cc ON c.cluster_id = cc.cluster_id
 )
-SELECT 
+SELECT /*+ BROADCAST(gt) */
     c.driver_node_type,
-    nt.core_count AS driver_vcpus,
-    ROUND(nt.memory_mb / 1024, 1) AS driver_memory_gb,
+    c.core_count AS driver_vcpus,
+    ROUND(c.memory_mb / 1024, 1) AS driver_memory_gb,
     COUNT(DISTINCT c.cluster_id) AS cluster_count,
-    ROUND(SUM(COALESCE(cc.total_dbus, 0)), 2) AS total_dbus,
-    ROUND(SUM(COALESCE(cc.total_cost_usd, 0)), 2) AS total_cost_usd,
-    ROUND(SUM(COALESCE(cc.total_cost_usd, 0)) * 100.0 / NULLIF(SUM(SUM(COALESCE(cc.total_cost_usd, 0))) OVER (), 0), 2) AS pct_of_total_cost,
+    ROUND(COALESCE(SUM(cc.total_dbus), 0), 2) AS total_dbus,
+    ROUND(COALESCE(SUM(cc.total_cost_usd), 0), 2) AS total_cost_usd,
+    ROUND(COALESCE(SUM(cc.total_cost_usd), 0) * 100.0 / NULLIF(gt.total_cost_usd, 0), 2) AS pct_of_total_cost,
     CASE 
-        WHEN nt.core_count > 32 THEN 'Consider Standard_E8ds_v5 (8 vCPU, 64GB)'
-        WHEN nt.core_count > 16 THEN 'Consider Standard_E4ds_v5 (4 vCPU, 32GB)'
+        WHEN c.core_count > 32 THEN 'Consider Standard_E8ds_v5 (8 vCPU, 64GB)'
+        WHEN c.core_count > 16 THEN 'Consider Standard_E4ds_v5 (4 vCPU, 32GB)'
         ELSE 'Review workload requirements'
     END AS recommendation
-FROM system.compute.clusters c
-JOIN system.compute.node_types nt 
-    ON c.driver_node_type = nt.node_type
+FROM oversized_drivers c
 LEFT JOIN cluster_costs cc ON c.cluster_id = cc.cluster_id
-WHERE c.delete_time IS NULL
-    AND c.change_time >= date_sub(current_date(), {lookback_days})
-    AND {workspace_clause}
-    AND (nt.core_count > {driver_cpu_threshold} OR nt.memory_mb / 1024 > {driver_memory_gb_threshold})
-GROUP BY c.driver_node_type, nt.core_count, nt.memory_mb
+CROSS JOIN grand_total gt
+GROUP BY c.driver_node_type, c.core_count, c.memory_mb, gt.total_cost_usd
 ORDER BY total_cost_usd DESC
 """
-display(spark.sql(driver_sizing_summary_query))
+sections.submit("driver_sizing_summary", driver_sizing_summary_query, small_result=True)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ---
+# MAGIC ## 📋 Analysis Results
+# MAGIC 
+# MAGIC The section queries above were submitted to run concurrently. Each cell below waits for its query to finish and displays the result.
+
+# COMMAND ----------
+
+# 1️⃣ Cluster-Level DBR Analysis
+display(sections.result("outdated_dbr"))
+
+# COMMAND ----------
+
+# 1️⃣ DBR Version Distribution Summary
+display(sections.result("dbr_distribution"))
+
+# COMMAND ----------
+
+# 2️⃣ Cluster-Level VM Generation Analysis
+display(sections.result("old_vm"))
+
+# COMMAND ----------
+
+# 2️⃣ VM Generation Distribution by Series
+display(sections.result("vm_distribution"))
+
+# COMMAND ----------
+
+# 3️⃣ Cluster-Level Driver Analysis
+display(sections.result("oversized_driver"))
+
+# COMMAND ----------
+
+# 3️⃣ Driver Sizing Summary
+display(sections.result("driver_sizing_summary"))
 
 # COMMAND ----------
 
@@ -739,186 +762,108 @@ display(spark.sql(driver_sizing_summary_query))
 # COMMAND ----------
 
 # Generate executive summary with cost data
-from pyspark.sql import functions as F
-
-summary_data = []
+# The four issue categories share one schema, so they run as a single UNION ALL query (one Spark job)
+executive_summary_query = f"""
+WITH clusters_with_threshold AS (
+    SELECT /*+ BROADCAST(t_driver, t_worker) */
+        c.cluster_id
+    FROM active_clusters c
+    LEFT JOIN vm_thresholds t_driver ON c.driver_series_prefix = t_driver.series_prefix
+    LEFT JOIN vm_thresholds t_worker ON c.worker_series_prefix = t_worker.series_prefix
+    WHERE COALESCE(c.driver_gen, 99) < COALESCE(t_driver.min_gen, :vm_threshold_default)
+       OR COALESCE(c.worker_gen, 99) < COALESCE(t_worker.min_gen, :vm_threshold_default)
+),
+oversized_drivers AS (
+    SELECT 
+        c.cluster_id
+    FROM active_clusters c
+    WHERE (c.driver_cores > :driver_cpu_threshold OR c.driver_memory_mb / 1024 > :driver_memory_gb_threshold)
+),
+issue_clusters AS (
+    -- 1. DBR Critical (< 6 months to EOS OR Non-LTS)
+    SELECT 1 AS sort_order, cluster_id
+    FROM active_clusters
+    WHERE {lts_version_sql} IS NULL
+       OR {days_until_eos_sql} < 180
+    UNION ALL
+    -- 2. DBR Warning (< 1 year to end-of-support)
+    SELECT 2, cluster_id
+    FROM active_clusters
+    WHERE {days_until_eos_sql} BETWEEN 180 AND 365
+    UNION ALL
+    -- 3. Old VM Generation (using series-specific thresholds)
+    SELECT 3, cluster_id
+    FROM clusters_with_threshold
+    UNION ALL
+    -- 4. Oversized Drivers
+    SELECT 4, cluster_id
+    FROM oversized_drivers
+),
+issue_categories AS (
+    SELECT * FROM VALUES
+        (1, '🔴 DBR Critical (Non-LTS or <6mo to EOS)', 'Immediate upgrade to LTS required'),
+        (2, '🟠 DBR Warning (<1 year to EOS)', 'Plan upgrade within 6 months'),
+        (3, '🔸 Older VM Generations (Below Threshold)', 'Upgrade VMs to recommended generation'),
+        (4, '🔸 Oversized Driver Nodes', 'Right-size driver configurations')
+    AS t(sort_order, issue_category, recommendation)
+)
+-- Categories with no affected clusters still appear with zero counts
+SELECT 
+    ic.issue_category AS `Issue Category`,
+    COUNT(DISTINCT i.cluster_id) AS `Affected Clusters`,
+    ROUND(COALESCE(SUM(cc.total_dbus), 0), 2) AS `Total DBUs`,
+    ROUND(COALESCE(SUM(cc.total_cost_usd), 0), 2) AS `Total Cost (USD)`,
+    ic.recommendation AS `Recommendation`
+FROM issue_categories ic
+LEFT JOIN issue_clusters i ON ic.sort_order = i.sort_order
+LEFT JOIN cluster_costs cc ON i.cluster_id = cc.cluster_id
+GROUP BY ic.sort_order, ic.issue_category, ic.recommendation
+ORDER BY ic.sort_order
+"""
 
-# 1. DBR Critical (< 6 months to EOS OR Non-LTS) - with cost
 try:
-    critical_dbr_df = spark.sql(f"""
-        WITH cluster_dbr AS (
-            SELECT 
-                c.cluster_id,
-                REGEXP_EXTRACT(c.dbr_version, '([0-9]+\\.[0-9]+)', 1) AS dbr_major_minor
-            FROM system.compute.clusters c
-            WHERE c.delete_time IS NULL
-                AND c.change_time >= date_sub(current_date(), {lookback_days})
-                AND {workspace_clause}
-        ),
-        cluster_costs AS (
-            SELECT 
-                u.usage_metadata.cluster_id, 
-                SUM(u.usage_quantity) AS total_dbus,
-                SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)) AS total_cost_usd
-            FROM system.billing.usage u
-            LEFT JOIN system.billing.list_prices lp 
-                ON u.sku_name = lp.sku_name
-                AND u.usage_start_time >= lp.price_start_time
-                AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-            WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-            GROUP BY u.usage_metadata.cluster_id
-        )
-        SELECT 
-            COUNT(DISTINCT cd.cluster_id) as cluster_count,
-            ROUND(SUM(COALESCE(cc.total_dbus, 0)), 2) as total_dbus,
-            ROUND(SUM(COALESCE(cc.total_cost_usd, 0)), 2) as total_cost_usd
-        FROM cluster_dbr cd
-        LEFT JOIN dbr_lts_support s ON cd.dbr_major_minor = s.lts_version
-        LEFT JOIN cluster_costs cc ON cd.cluster_id = cc.cluster_id
-        WHERE s.lts_version IS NULL
-           OR DATEDIFF(DATE(s.end_of_support), current_date()) < 180
-    """)
-    row = critical_dbr_df.collect()[0]
-    summary_data.append(("🔴 DBR Critical (Non-LTS or <6mo to EOS)", row['cluster_count'], row['total_dbus'], row['total_cost_usd'], "Immediate upgrade to LTS required"))
+    display(spark.sql(executive_summary_query, args=query_params))
 except Exception as e:
-    print(f"Note: Could not query DBR versions - {e}")
+    print(f"Unable to generate summary - please check system table access permissions - {e}")
 
-# 2. DBR Warning (< 1 year to end-of-support) - with cost
-try:
-    warning_dbr_df = spark.sql(f"""
-        WITH cluster_dbr AS (
-            SELECT 
-                c.cluster_id,
-                REGEXP_EXTRACT(c.dbr_version, '([0-9]+\\.[0-9]+)', 1) AS dbr_major_minor
-            FROM system.compute.clusters c
-            WHERE c.delete_time IS NULL
-                AND c.change_time >= date_sub(current_date(), {lookback_days})
-                AND {workspace_clause}
-        ),
-        cluster_costs AS (
-            SELECT 
-                u.usage_metadata.cluster_id, 
-                SUM(u.usage_quantity) AS total_dbus,
-                SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)) AS total_cost_usd
-            FROM system.billing.usage u
-            LEFT JOIN system.billing.list_prices lp 
-                ON u.sku_name = lp.sku_name
-                AND u.usage_start_time >= lp.price_start_time
-                AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-            WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-            GROUP BY u.usage_metadata.cluster_id
-        )
-        SELECT 
-            COUNT(DISTINCT cd.cluster_id) as cluster_count,
-            ROUND(SUM(COALESCE(cc.total_dbus, 0)), 2) as total_dbus,
-            ROUND(SUM(COALESCE(cc.total_cost_usd, 0)), 2) as total_cost_usd
-        FROM cluster_dbr cd
-        JOIN dbr_lts_support s ON cd.dbr_major_minor = s.lts_version
-        LEFT JOIN cluster_costs cc ON cd.cluster_id = cc.cluster_id
-        WHERE DATEDIFF(DATE(s.end_of_support), current_date()) BETWEEN 180 AND 365
-    """)
-    row = warning_dbr_df.collect()[0]
-    summary_data.append(("🟠 DBR Warning (<1 year to EOS)", row['cluster_count'], row['total_dbus'], row['total_cost_usd'], "Plan upgrade within 6 months"))
-except Exception as e:
-    print(f"Note: Could not query DBR versions - {e}")
+# COMMAND ----------
 
-# 3. Old VM Generation - with cost (using series-specific thresholds)
-try:
-    old_vm_df = spark.sql(f"""
-        WITH cluster_costs AS (
-            SELECT 
-                u.usage_metadata.cluster_id, 
-                SUM(u.usage_quantity) AS total_dbus,
-                SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)) AS total_cost_usd
-            FROM system.billing.usage u
-            LEFT JOIN system.billing.list_prices lp 
-                ON u.sku_name = lp.sku_name
-                AND u.usage_start_time >= lp.price_start_time
-                AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-            WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-            GROUP BY u.usage_metadata.cluster_id
-        ),
-        clusters_with_threshold AS (
-            SELECT 
-                c.cluster_id,
-                TRY_CAST(REGEXP_EXTRACT(c.driver_node_type, '_v([0-9]+)', 1) AS INT) AS driver_gen,
-                TRY_CAST(REGEXP_EXTRACT(c.worker_node_type, '_v([0-9]+)', 1) AS INT) AS worker_gen,
-                CASE 
-                    WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'D%' THEN {vm_threshold_D}
-                    WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'E%' THEN {vm_threshold_E}
-                    WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'F%' THEN {vm_threshold_F}
-                    WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'L%' THEN {vm_threshold_L}
-                    WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'M%' THEN {vm_threshold_M}
-                    WHEN REGEXP_EXTRACT(c.driver_node_type, 'Standard_([A-Z]+)', 1) LIKE 'N%' THEN {vm_threshold_N}
-                    ELSE {vm_threshold_default}
-                END AS driver_threshold,
-                CASE 
-                    WHEN REGEXP_EXTRACT(c.worker_node_type, 'Standard_([A-Z]+)', 1) LIKE 'D%' THEN {vm_threshold_D}
-                    WHEN REGEXP_EXTRACT(c.worker_node_type, 'Standard_([A-Z]+)', 1) LIKE 'E%' THEN {vm_threshold_E}
-                    WHEN REGEXP_EXTRACT(c.worker_node_type, 'Standard_([A-Z]+)', 1) LIKE 'F%' THEN {vm_threshold_F}
-                    WHEN REGEXP_EXTRACT(c.worker_node_type, 'Standard_([A-Z]+)', 1) LIKE 'L%' THEN {vm_threshold_L}
-                    WHEN REGEXP_EXTRACT(c.worker_node_type, 'Standard_([A-Z]+)', 1) LIKE 'M%' THEN {vm_threshold_M}
-                    WHEN REGEXP_EXTRACT(c.worker_node_type, 'Standard_([A-Z]+)', 1) LIKE 'N%' THEN {vm_threshold_N}
-                    ELSE {vm_threshold_default}
-                END AS worker_threshold
-            FROM system.compute.clusters c
-            WHERE c.delete_time IS NULL
-                AND c.change_time >= date_sub(current_date(), {lookback_days})
-                AND {workspace_clause}
-        )
-        SELECT 
-            COUNT(DISTINCT ct.cluster_id) as cluster_count,
-            ROUND(SUM(COALESCE(cc.total_dbus, 0)), 2) as total_dbus,
-            ROUND(SUM(COALESCE(cc.total_cost_usd, 0)), 2) as total_cost_usd
-        FROM clusters_with_threshold ct
-        LEFT JOIN cluster_costs cc ON ct.cluster_id = cc.cluster_id
-        WHERE COALESCE(ct.driver_gen, 99) < ct.driver_threshold
-           OR COALESCE(ct.worker_gen, 99) < ct.worker_threshold
-    """)
-    row = old_vm_df.collect()[0]
-    summary_data.append(("🔸 Older VM Generations (Below Threshold)", row['cluster_count'], row['total_dbus'], row['total_cost_usd'], "Upgrade VMs to recommended generation"))
-except Exception as e:
-    print(f"Note: Could not query VM generations - {e}")
+# MAGIC %md
+# MAGIC ---
+# MAGIC ## 💾 Save Results (Optional)
+# MAGIC 
+# MAGIC When **Save Results** is set to `Yes`, the cluster-level findings are appended to these tables in the output location:
+# MAGIC 
+# MAGIC | Table | Contents |
+# MAGIC |-------|----------|
+# MAGIC | `outdated_dbr_clusters` | Clusters on non-LTS or expiring DBR versions |
+# MAGIC | `old_vm_clusters` | Clusters below the VM generation threshold |
+# MAGIC | `oversized_driver_clusters` | Clusters with oversized drivers |
+# MAGIC 
+# MAGIC The tables are written by `save_results_table` in `Shared_Functions`, which describes their `analysis_date` column and Liquid Clustering layout.
+# MAGIC 
+# MAGIC > 💡 **Tip**: When scheduling this notebook as a job, run it on **Photon** compute - the analysis is made of SQL joins and aggregations, which Photon accelerates.
 
-# 4. Oversized Drivers - with cost
-try:
-    oversized_driver_df = spark.sql(f"""
-        WITH cluster_costs AS (
-            SELECT 
-                u.usage_metadata.cluster_id, 
-                SUM(u.usage_quantity) AS total_dbus,
-                SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)) AS total_cost_usd
-            FROM system.billing.usage u
-            LEFT JOIN system.billing.list_prices lp 
-                ON u.sku_name = lp.sku_name
-                AND u.usage_start_time >= lp.price_start_time
-                AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-            WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-            GROUP BY u.usage_metadata.cluster_id
-        )
-        SELECT 
-            COUNT(DISTINCT c.cluster_id) as cluster_count,
-            ROUND(SUM(COALESCE(cc.total_dbus, 0)), 2) as total_dbus,
-            ROUND(SUM(COALESCE(cc.total_cost_usd, 0)), 2) as total_cost_usd
-        FROM system.compute.clusters c
-        JOIN system.compute.node_types nt ON c.driver_node_type = nt.node_type
-        LEFT JOIN cluster_costs cc ON c.cluster_id = cc.cluster_id
-        WHERE c.delete_time IS NULL
-            AND c.change_time >= date_sub(current_date(), {lookback_days})
-            AND {workspace_clause}
-            AND (nt.core_count > {driver_cpu_threshold} OR nt.memory_mb / 1024 > {driver_memory_gb_threshold})
-    """)
-    row = oversized_driver_df.collect()[0]
-    summary_data.append(("🔸 Oversized Driver Nodes", row['cluster_count'], row['total_dbus'], row['total_cost_usd'], "Right-size driver configurations"))
-except Exception as e:
-    print(f"Note: Could not query driver sizes - {e}")
+# COMMAND ----------
 
-# Create summary DataFrame
-if summary_data:
-    summary_df = spark.createDataFrame(summary_data, ["Issue Category", "Affected Clusters", "Total DBUs", "Total Cost (USD)", "Recommendation"])
-    display(summary_df)
+if save_results:
+    try:
+        save_results_table(sections.result("outdated_dbr"), "outdated_dbr_clusters", output_location)
+        save_results_table(sections.result("old_vm"), "old_vm_clusters", output_location)
+        save_results_table(sections.result("oversized_driver"), "oversized_driver_clusters", output_location)
+    except Exception as e:
+        print(f"Note: Could not save results to {output_location} - {e}")
 else:
-    print("Unable to generate summary - please check system table access permissions")
+    print("Skipping save - set the 'Save Results' widget to 'Yes' to persist findings")
+
+# COMMAND ----------
+
+# Release cached shared data and section results now that all sections have run
+try:
+    sections.close()
+finally:
+    uncache_df(cluster_costs_df)
+    uncache_df(active_clusters_df)
 
 # COMMAND ----------
 
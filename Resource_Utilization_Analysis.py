@@ -8,6 +8,8 @@
 # MAGIC 
 # MAGIC > 💡 **Best Practice**: First optimize your **workload & data layout** (query tuning, partitioning, Liquid Clustering, caching), then scale hardware if needed. Don't throw resources at inefficient code.
 # MAGIC 
+# MAGIC > ⚡ **Performance**: Every query in this notebook is a Spark SQL join or aggregation over system tables, which Photon accelerates. Run it on **Photon-enabled compute** (a Photon cluster or serverless notebook compute) for a faster end-to-end run.
+# MAGIC 
 # MAGIC ---
 # MAGIC 
 # MAGIC ## 📋 What This Notebook Does
@@ -42,21 +44,31 @@
 
 # COMMAND ----------
 
+# MAGIC %run ./Shared_Functions
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ---
 # MAGIC ## ⚙️ Configuration Widgets
+# MAGIC 
+# MAGIC > **Note**: The notebook only writes to the output location when **Save Results** or **Use Cache Tables** is `Yes`. With **Use Cache Tables**, the workspace list for the dropdown is cached in `<output_catalog>.<output_schema>.workspace_ids_cache` (shared with the Cluster Optimization notebook) and refreshed once a day, and utilization and costs are kept in `cluster_node_daily` and `cluster_cost_daily` (see Shared Data). Without write access to the output location, the system tables are read directly.
 
 # COMMAND ----------
 
+# Output location for saving results
+dbutils.widgets.text("output_catalog", "dbdemos_steventan", "Output Catalog")
+dbutils.widgets.text("output_schema", "waf", "Output Schema")
+dbutils.widgets.dropdown("save_results", "No", ["No", "Yes"], "Save Results to Output Tables")
+dbutils.widgets.dropdown("use_cache_tables", "No", ["No", "Yes"], "Use Cache Tables in Output Location")
+
 # Get available workspace IDs for the dropdown
 try:
-    workspace_ids_df = spark.sql("""
-        SELECT DISTINCT workspace_id 
-        FROM system.compute.clusters 
-        WHERE workspace_id IS NOT NULL 
-        ORDER BY workspace_id
-    """)
-    available_workspaces = [row.workspace_id for row in workspace_ids_df.collect()]
+    # Same cache table as Cluster_Optimization_Analysis, so either notebook keeps it fresh for the other
+    available_workspaces = load_workspace_ids(
+        f"{dbutils.widgets.get('output_catalog')}.{dbutils.widgets.get('output_schema')}",
+        dbutils.widgets.get("use_cache_tables") == "Yes",
+    )
     workspace_options = ["ALL"] + available_workspaces
 except:
     workspace_options = ["ALL"]
@@ -65,10 +77,6 @@ except:
 dbutils.widgets.dropdown("lookback_days", "30", ["7", "14", "30", "60", "90", "180"], "Lookback Period (Days)")
 dbutils.widgets.combobox("workspace_filter", "ALL", workspace_options, "Workspace ID Filter")
 
-# Output location for saving results
-dbutils.widgets.text("output_catalog", "dbdemos_steventan", "Output Catalog")
-dbutils.widgets.text("output_schema", "waf", "Output Schema")
-
 # Resource utilization thresholds
 dbutils.widgets.dropdown("cpu_threshold", "70", ["30", "50", "60", "70", "80", "90"], "CPU-bound Threshold (%)")
 dbutils.widgets.dropdown("io_wait_threshold", "10", ["5", "10", "15", "20", "30"], "I/O Wait Threshold (%)")
@@ -78,10 +86,15 @@ dbutils.widgets.dropdown("swap_threshold", "1", ["1", "2", "5", "10"], "Swap Thr
 # COMMAND ----------
 
 # Get widget values
-lookback_days = dbutils.widgets.get("lookback_days")
-workspace_filter = dbutils.widgets.get("workspace_filter")
+lookback_days = int(dbutils.widgets.get("lookback_days"))
+lookback_start_date = date.today() - timedelta(days=lookback_days)
+workspace_filter = dbutils.widgets.get("workspace_filter").strip()
+if workspace_filter != "ALL" and not workspace_filter.isdigit():
+    raise ValueError(f"Invalid Workspace ID Filter '{workspace_filter}' - choose ALL or a numeric workspace ID")
 output_catalog = dbutils.widgets.get("output_catalog")
 output_schema = dbutils.widgets.get("output_schema")
+save_results = dbutils.widgets.get("save_results") == "Yes"
+use_cache_tables = dbutils.widgets.get("use_cache_tables") == "Yes"
 
 # Get threshold values
 cpu_threshold = int(dbutils.widgets.get("cpu_threshold"))
@@ -89,24 +102,244 @@ io_wait_threshold = int(dbutils.widgets.get("io_wait_threshold"))
 memory_threshold = int(dbutils.widgets.get("memory_threshold"))
 swap_threshold = int(dbutils.widgets.get("swap_threshold"))
 
-# Build workspace filter clause
-if workspace_filter == "ALL":
-    workspace_clause = "1=1"
-else:
-    workspace_clause = f"c.workspace_id = '{workspace_filter}'"
+query_params = {
+    "lookback_start_date": lookback_start_date,
+    "workspace_filter": workspace_filter,
+    "cpu_threshold": cpu_threshold,
+    "io_wait_threshold": io_wait_threshold,
+    "memory_threshold": memory_threshold,
+    "swap_threshold": swap_threshold,
+}
+
+# Cluster-level reports are displayed top-N by cost (display() renders at most 10,000 rows anyway); saved results are not capped
+max_report_rows = 10000
+
+# Keep the node_timeline and billing files read by this session on local disk, so re-runs on the same cluster skip cloud storage
+try:
+    spark.conf.set("spark.databricks.io.cache.enabled", "true")
+except Exception:
+    pass  # Serverless/SQL warehouses manage caching themselves
 
 output_location = f"{output_catalog}.{output_schema}"
 
 print(f"📊 Analysis Configuration:")
-print(f"   • Lookback period: {lookback_days} days")
+print(f"   • Lookback period: {lookback_days} days (since {lookback_start_date})")
 print(f"   • Workspace filter: {workspace_filter}")
 print(f"   • Output location: {output_location}")
+print(f"   • Save results: {'Yes' if save_results else 'No'}")
+print(f"   • Use cache tables: {'Yes' if use_cache_tables else 'No'}")
 print(f"   • CPU-bound threshold: >= {cpu_threshold}%")
 print(f"   • I/O wait threshold: >= {io_wait_threshold}%")
 print(f"   • Memory-bound threshold: memory >= {memory_threshold}% OR swap >= {swap_threshold}%")
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC ---
+# MAGIC ## 🧮 Shared Data
+# MAGIC 
+# MAGIC All sections below work on the same per-cluster utilization and cost figures. The cells below compute these **once**, cache them, and register them as temp views so the system tables are only scanned a single time per run:
+# MAGIC 
+# MAGIC | Temp View | Contents |
+# MAGIC |-----------|----------|
+# MAGIC | `active_clusters` | Clusters active in the lookback period (after workspace filter), projected to the columns the sections use, with the runtime type (Standard/ML/GPU) classified once |
+# MAGIC | `cluster_node_stats` | Average and peak CPU, I/O wait, memory and swap of worker nodes, plus days active, per cluster over the lookback period (from `system.compute.node_timeline`) |
+# MAGIC | `cluster_costs` | DBU consumption and list-price cost per cluster over the lookback period |
+# MAGIC | `cluster_utilization` | `active_clusters` joined with `cluster_node_stats` and `cluster_costs` - the input of every section below |
+# MAGIC 
+# MAGIC With **Use Cache Tables** set to `Yes`, two Delta tables in the output location are kept up to date and read instead of the full lookback period of the system tables:
+# MAGIC - `cluster_node_stats` is re-averaged from `<output_catalog>.<output_schema>.cluster_node_daily`, a rollup of per-cluster, per-day sample counts, sums and peaks of worker utilization. Each run only aggregates `node_timeline` samples since the last refresh, so the per-minute samples of earlier days are never rescanned.
+# MAGIC - `cluster_costs` is summed from `<output_catalog>.<output_schema>.cluster_cost_daily`, a table of daily DBUs and cost per cluster shared with the Cluster Optimization notebook. Prices are resolved once per usage record when a day is added to the table, so the time-ranged `list_prices` join only runs over billing data since the last refresh (plus a few days for late-arriving records).
+# MAGIC 
+# MAGIC Otherwise, or without write access to the output location, `node_timeline` and the billing tables are aggregated directly. Without `node_timeline` access nothing is computed or written, since every section needs it.
+# MAGIC 
+# MAGIC The section queries are independent of each other, so each one is **submitted to a thread pool** as soon as it is defined and runs in the background while the notebook continues. All results are displayed together in the **📋 Analysis Results** section.
+
+# COMMAND ----------
+
+# Active clusters in the lookback period with the runtime type classified once
+active_clusters_df = spark.sql("""
+    SELECT 
+        c.account_id,
+        c.workspace_id,
+        c.cluster_id,
+        c.cluster_name,
+        c.owned_by,
+        c.dbr_version,
+        c.driver_node_type,
+        c.worker_node_type,
+        c.dbr_version ILIKE '%ml%' AS is_ml_runtime,
+        CASE 
+            WHEN c.dbr_version ILIKE '%ml%' THEN '🤖 ML Runtime'
+            WHEN c.dbr_version ILIKE '%gpu%' THEN '🎮 GPU Runtime'
+            ELSE '📊 Standard Runtime'
+        END AS runtime_type
+    FROM system.compute.clusters c
+    WHERE c.delete_time IS NULL
+        AND c.change_time >= :lookback_start_date
+""", args=query_params)
+
+if workspace_filter != "ALL":
+    active_clusters_df = active_clusters_df.where(F.col("workspace_id") == F.lit(workspace_filter))
+cache_df(active_clusters_df).createOrReplaceTempView("active_clusters")
+
+print("✅ Created cached temp view: active_clusters")
+
+# COMMAND ----------
+
+# Probe node_timeline access once; without it every utilization section below is skipped
+try:
+    spark.sql("SELECT 1 FROM system.compute.node_timeline LIMIT 1").collect()
+    has_node_timeline = True
+except Exception as e:
+    has_node_timeline = False
+    print(f"⚠️ Could not query node_timeline utilization data: {e}")
+    print("Ensure you have SELECT access to system.compute.node_timeline.")
+
+# Daily per-cluster worker utilization rollup, kept in a Delta table so each run only re-aggregates the latest days of node_timeline
+cluster_node_daily_table = f"{output_location}.cluster_node_daily"
+cluster_node_max_lookback_days = 180  # Longest lookback offered by the widget
+cluster_node_restate_days = 1         # The last refreshed day was partial and is recomputed
+
+cluster_node_daily_query = """
+    SELECT 
+        workspace_id,
+        cluster_id,
+        DATE(start_time) AS sample_date,
+        -- Sums and non-NULL sample counts (not averages) so any range of days can be re-averaged exactly like AVG
+        COUNT(cpu_user_percent + cpu_system_percent) AS cpu_percent_count,
+        SUM(cpu_user_percent + cpu_system_percent) AS cpu_percent_sum,
+        MAX(cpu_user_percent + cpu_system_percent) AS cpu_percent_max,
+        COUNT(cpu_wait_percent) AS io_wait_percent_count,
+        SUM(cpu_wait_percent) AS io_wait_percent_sum,
+        MAX(cpu_wait_percent) AS io_wait_percent_max,
+        COUNT(mem_used_percent) AS memory_percent_count,
+        SUM(mem_used_percent) AS memory_percent_sum,
+        MAX(mem_used_percent) AS memory_percent_max,
+        COUNT(mem_swap_percent) AS swap_percent_count,
+        SUM(mem_swap_percent) AS swap_percent_sum,
+        MAX(mem_swap_percent) AS swap_percent_max
+    FROM system.compute.node_timeline
+    WHERE start_time >= :refresh_from
+        AND driver = false  -- Only worker nodes (where the actual compute happens)
+    GROUP BY workspace_id, cluster_id, DATE(start_time)
+"""
+
+# Per-cluster worker utilization over the lookback period (shared by all sections)
+if has_node_timeline:
+    cluster_node_stats_df = None
+    if use_cache_tables:
+        try:
+            refresh_daily_table(
+                cluster_node_daily_table, cluster_node_daily_query, "sample_date",
+                cluster_node_max_lookback_days, cluster_node_restate_days,
+            )
+            cluster_node_stats_df = spark.sql(f"""
+                SELECT /*+ BROADCAST(ac) */
+                    nd.cluster_id,
+                    SUM(nd.cpu_percent_sum) / SUM(nd.cpu_percent_count) AS avg_cpu_percent,
+                    MAX(nd.cpu_percent_max) AS max_cpu_percent,
+                    SUM(nd.io_wait_percent_sum) / SUM(nd.io_wait_percent_count) AS avg_io_wait_percent,
+                    MAX(nd.io_wait_percent_max) AS max_io_wait_percent,
+                    SUM(nd.memory_percent_sum) / SUM(nd.memory_percent_count) AS avg_memory_percent,
+                    MAX(nd.memory_percent_max) AS max_memory_percent,
+                    SUM(nd.swap_percent_sum) / SUM(nd.swap_percent_count) AS avg_swap_percent,
+                    MAX(nd.swap_percent_max) AS max_swap_percent,
+                    COUNT(*) AS days_active  -- One rollup row per cluster and day
+                FROM {cluster_node_daily_table} nd
+                LEFT SEMI JOIN active_clusters ac ON nd.cluster_id = ac.cluster_id
+                WHERE nd.sample_date >= :lookback_start_date
+                    AND (:workspace_filter = 'ALL' OR nd.workspace_id = :workspace_filter)
+                GROUP BY nd.cluster_id
+            """, args=query_params)
+        except Exception as e:
+            print(f"Note: Could not refresh {cluster_node_daily_table}, reading system.compute.node_timeline directly - {e}")
+    if cluster_node_stats_df is None:
+        # Cache tables not used (or no write access to the output location) - aggregate node_timeline directly in a single pass
+        cluster_node_stats_df = spark.sql("""
+            WITH worker_samples AS (
+                -- Semi-join applied here, so stats are only aggregated for clusters that can be reported
+                -- CPU busy percent is computed once per sample and shared by AVG and MAX
+                SELECT /*+ BROADCAST(ac) */
+                    nt.cluster_id,
+                    DATE(nt.start_time) AS sample_date,
+                    nt.cpu_user_percent + nt.cpu_system_percent AS cpu_percent,
+                    nt.cpu_wait_percent,
+                    nt.mem_used_percent,
+                    nt.mem_swap_percent
+                FROM system.compute.node_timeline nt
+                LEFT SEMI JOIN active_clusters ac ON nt.cluster_id = ac.cluster_id
+                WHERE nt.start_time >= :lookback_start_date
+                    AND nt.driver = false  -- Only worker nodes (where the actual compute happens)
+                    -- Workspace predicate on the scan itself (folds away for ALL), so files of other workspaces are skipped
+                    AND (:workspace_filter = 'ALL' OR nt.workspace_id = :workspace_filter)
+            )
+            SELECT 
+                cluster_id,
+                AVG(cpu_percent) AS avg_cpu_percent,
+                MAX(cpu_percent) AS max_cpu_percent,
+                AVG(cpu_wait_percent) AS avg_io_wait_percent,
+                MAX(cpu_wait_percent) AS max_io_wait_percent,
+                AVG(mem_used_percent) AS avg_memory_percent,
+                MAX(mem_used_percent) AS max_memory_percent,
+                AVG(mem_swap_percent) AS avg_swap_percent,
+                MAX(mem_swap_percent) AS max_swap_percent,
+                COUNT(DISTINCT sample_date) AS days_active
+            FROM worker_samples
+            GROUP BY cluster_id
+        """, args=query_params)
+    cache_df(cluster_node_stats_df).createOrReplaceTempView("cluster_node_stats")
+    print("✅ Created cached temp view: cluster_node_stats")
+
+# COMMAND ----------
+
+# Cache table of daily DBUs and cost per cluster (see load_cluster_costs in Shared_Functions)
+cluster_cost_daily_table = f"{output_location}.cluster_cost_daily"
+
+# Per-cluster DBUs and cost over the lookback period (only read by cluster_utilization, so skipped without node_timeline)
+if has_node_timeline:
+    cluster_costs_df = load_cluster_costs(cluster_cost_daily_table, lookback_start_date, use_cache_tables)
+    # Keep only clusters that can be reported; the semi-join is pushed below the aggregation into the billing scan
+    cluster_costs_df = cluster_costs_df.join(F.broadcast(active_clusters_df.select("cluster_id")), "cluster_id", "left_semi")
+    cache_df(cluster_costs_df).createOrReplaceTempView("cluster_costs")
+    print("✅ Created cached temp view: cluster_costs")
+
+# COMMAND ----------
+
+# Clusters joined with their utilization and cost once; each section only filters and projects this view
+if has_node_timeline:
+    cluster_utilization_df = spark.sql("""
+        SELECT /*+ BROADCAST(c, cc) */
+            -- Cluster attributes and costs are small per-cluster tables; broadcasting them avoids shuffling the stats side
+            c.*,
+            ns.avg_cpu_percent,
+            ns.max_cpu_percent,
+            ns.avg_io_wait_percent,
+            ns.max_io_wait_percent,
+            ns.avg_memory_percent,
+            ns.max_memory_percent,
+            ns.avg_swap_percent,
+            ns.max_swap_percent,
+            ns.days_active,
+            cc.total_dbus,
+            cc.total_cost_usd
+        FROM active_clusters c
+        JOIN cluster_node_stats ns ON c.cluster_id = ns.cluster_id
+        LEFT JOIN cluster_costs cc ON c.cluster_id = cc.cluster_id
+    """)
+    cache_df(cluster_utilization_df).createOrReplaceTempView("cluster_utilization")
+    # Materialize the whole shared lineage (clusters, node stats, costs) in one job, before any section reads it
+    if not is_serverless:
+        cluster_utilization_df.count()
+    print("✅ Created cached temp view: cluster_utilization")
+
+# COMMAND ----------
+
+# Section queries (see SectionQueries in Shared_Functions)
+sections = SectionQueries(query_params, max_workers=4)
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ---
 # MAGIC ## 5️⃣ Resource Utilization Analysis
@@ -123,39 +356,13 @@ print(f"   • Memory-bound threshold: memory >= {memory_threshold}% OR swap >=
 # MAGIC - **Compute-optimized nodes** - Higher clock speeds, more cores per node
 # MAGIC - **Larger nodes or more workers** - More CPU cores to distribute load
 # MAGIC 
-# MAGIC > **Note**: This query uses `system.compute.node_timeline`. If you don't have access, this section will show an error.
+# MAGIC > **Note**: This query uses `system.compute.node_timeline` (via the `cluster_node_stats` view). If you don't have access, the utilization sections are skipped.
 
 # COMMAND ----------
 
 # High CPU Utilization Clusters
-# Using system.compute.node_timeline for CPU metrics
-try:
-    high_cpu_photon_query = f"""
-    WITH cluster_cpu_stats AS (
-        SELECT 
-            nt.cluster_id,
-            ROUND(AVG(nt.cpu_user_percent + nt.cpu_system_percent), 2) AS avg_cpu_percent,
-            ROUND(MAX(nt.cpu_user_percent + nt.cpu_system_percent), 2) AS max_cpu_percent,
-            COUNT(DISTINCT DATE(nt.start_time)) AS days_active
-        FROM system.compute.node_timeline nt
-        WHERE nt.start_time >= date_sub(current_date(), {lookback_days})
-            AND nt.driver = false  -- Only worker nodes (where the actual compute happens)
-        GROUP BY nt.cluster_id
-    ),
-    cluster_costs AS (
-        SELECT 
-            u.usage_metadata.cluster_id,
-            ROUND(SUM(u.usage_quantity), 2) AS total_dbus,
-            ROUND(SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)), 2) AS total_cost_usd
-        FROM system.billing.usage u
-        LEFT JOIN system.billing.list_prices lp 
-            ON u.sku_name = lp.sku_name
-            AND u.usage_start_time >= lp.price_start_time
-            AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-        WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-            AND u.usage_metadata.cluster_id IS NOT NULL
-        GROUP BY u.usage_metadata.cluster_id
-    )
+if has_node_timeline:
+    high_cpu_photon_query = """
     SELECT 
         c.account_id,
         c.workspace_id,
@@ -163,35 +370,25 @@ try:
         c.cluster_name,
         c.owned_by AS owner,
         c.dbr_version,
+        c.runtime_type,
+        ROUND(c.avg_cpu_percent, 2) AS avg_cpu_percent,
+        ROUND(c.max_cpu_percent, 2) AS max_cpu_percent,
+        c.days_active,
+        ROUND(COALESCE(c.total_dbus, 0), 2) AS total_dbus,
+        ROUND(COALESCE(c.total_cost_usd, 0), 2) AS total_cost_usd,
         CASE 
-            WHEN LOWER(c.dbr_version) LIKE '%ml%' THEN '🤖 ML Runtime'
-            WHEN LOWER(c.dbr_version) LIKE '%gpu%' THEN '🎮 GPU Runtime'
-            ELSE '📊 Standard Runtime'
-        END AS runtime_type,
-        cpu.avg_cpu_percent,
-        cpu.max_cpu_percent,
-        cpu.days_active,
-        COALESCE(cc.total_dbus, 0) AS total_dbus,
-        COALESCE(cc.total_cost_usd, 0) AS total_cost_usd,
-        CASE 
-            WHEN LOWER(c.dbr_version) LIKE '%ml%' AND cpu.avg_cpu_percent >= {cpu_threshold} THEN '🟠 ML Runtime - Photon helps Spark SQL/feature eng; or compute-optimized'
-            WHEN LOWER(c.dbr_version) LIKE '%ml%' THEN '🟡 ML Runtime - Evaluate if using Spark SQL/DataFrames'
-            WHEN cpu.avg_cpu_percent >= {cpu_threshold} THEN '🔴 CPU-bound - Photon, larger nodes, more workers'
+            WHEN c.is_ml_runtime AND c.avg_cpu_percent >= :cpu_threshold THEN '🟠 ML Runtime - Photon helps Spark SQL/feature eng; or compute-optimized'
+            WHEN c.is_ml_runtime THEN '🟡 ML Runtime - Evaluate if using Spark SQL/DataFrames'
+            WHEN c.avg_cpu_percent >= :cpu_threshold THEN '🔴 CPU-bound - Photon, larger nodes, more workers'
             ELSE '🟢 Below threshold - Not CPU-bound'
         END AS recommendation
-    FROM system.compute.clusters c
-    JOIN cluster_cpu_stats cpu ON c.cluster_id = cpu.cluster_id
-    LEFT JOIN cluster_costs cc ON c.cluster_id = cc.cluster_id
-    WHERE c.delete_time IS NULL
-        AND c.change_time >= date_sub(current_date(), {lookback_days})
-        AND {workspace_clause}
-        AND cpu.avg_cpu_percent >= {cpu_threshold}  -- Only show clusters above threshold
-    ORDER BY cc.total_cost_usd DESC NULLS LAST
+    FROM cluster_utilization c
+    WHERE c.avg_cpu_percent >= :cpu_threshold  -- Only show clusters above threshold
+    ORDER BY c.total_cost_usd DESC NULLS LAST
     """
-    display(spark.sql(high_cpu_photon_query))
-except Exception as e:
-    print(f"⚠️ Could not query CPU utilization data: {e}")
-    print("Ensure you have SELECT access to system.compute.node_timeline.")
+    sections.submit("high_cpu", high_cpu_photon_query, max_rows=max_report_rows)
+else:
+    print("⚠️ Skipped - system.compute.node_timeline is not accessible (see Shared Data)")
 
 # COMMAND ----------
 
@@ -207,34 +404,8 @@ except Exception as e:
 # COMMAND ----------
 
 # High I/O Wait Clusters - Delta Cache Candidates
-try:
-    high_io_wait_query = f"""
-    WITH cluster_io_stats AS (
-        SELECT 
-            nt.cluster_id,
-            ROUND(AVG(nt.cpu_wait_percent), 2) AS avg_io_wait_percent,
-            ROUND(MAX(nt.cpu_wait_percent), 2) AS max_io_wait_percent,
-            ROUND(AVG(nt.cpu_user_percent + nt.cpu_system_percent), 2) AS avg_cpu_percent
-        FROM system.compute.node_timeline nt
-        WHERE nt.start_time >= date_sub(current_date(), {lookback_days})
-            AND nt.driver = false
-        GROUP BY nt.cluster_id
-        HAVING AVG(nt.cpu_wait_percent) >= {io_wait_threshold}  -- Significant I/O wait
-    ),
-    cluster_costs AS (
-        SELECT 
-            u.usage_metadata.cluster_id,
-            ROUND(SUM(u.usage_quantity), 2) AS total_dbus,
-            ROUND(SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)), 2) AS total_cost_usd
-        FROM system.billing.usage u
-        LEFT JOIN system.billing.list_prices lp 
-            ON u.sku_name = lp.sku_name
-            AND u.usage_start_time >= lp.price_start_time
-            AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-        WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-            AND u.usage_metadata.cluster_id IS NOT NULL
-        GROUP BY u.usage_metadata.cluster_id
-    )
+if has_node_timeline:
+    high_io_wait_query = """
     SELECT 
         c.account_id,
         c.workspace_id,
@@ -242,29 +413,25 @@ try:
         c.cluster_name,
         c.owned_by AS owner,
         c.dbr_version,
-        io.avg_io_wait_percent,
-        io.max_io_wait_percent,
-        io.avg_cpu_percent,
+        ROUND(c.avg_io_wait_percent, 2) AS avg_io_wait_percent,
+        ROUND(c.max_io_wait_percent, 2) AS max_io_wait_percent,
+        ROUND(c.avg_cpu_percent, 2) AS avg_cpu_percent,
         c.driver_node_type,
         c.worker_node_type,
-        COALESCE(cc.total_dbus, 0) AS total_dbus,
-        COALESCE(cc.total_cost_usd, 0) AS total_cost_usd,
+        ROUND(COALESCE(c.total_dbus, 0), 2) AS total_dbus,
+        ROUND(COALESCE(c.total_cost_usd, 0), 2) AS total_cost_usd,
         CASE 
-            WHEN io.avg_io_wait_percent >= {io_wait_threshold} * 2 THEN '🔴 HIGH - Delta Cache + Liquid Clustering for file pruning'
-            WHEN io.avg_io_wait_percent >= {io_wait_threshold} THEN '🟠 I/O-bound - Delta Cache, Liquid Clustering'
+            WHEN c.avg_io_wait_percent >= :io_wait_threshold * 2 THEN '🔴 HIGH - Delta Cache + Liquid Clustering for file pruning'
+            WHEN c.avg_io_wait_percent >= :io_wait_threshold THEN '🟠 I/O-bound - Delta Cache, Liquid Clustering'
             ELSE '🟡 MODERATE - Consider Liquid Clustering for file pruning'
         END AS recommendation
-    FROM system.compute.clusters c
-    JOIN cluster_io_stats io ON c.cluster_id = io.cluster_id
-    LEFT JOIN cluster_costs cc ON c.cluster_id = cc.cluster_id
-    WHERE c.delete_time IS NULL
-        AND c.change_time >= date_sub(current_date(), {lookback_days})
-        AND {workspace_clause}
-    ORDER BY cc.total_cost_usd DESC NULLS LAST
+    FROM cluster_utilization c
+    WHERE c.avg_io_wait_percent >= :io_wait_threshold  -- Significant I/O wait
+    ORDER BY c.total_cost_usd DESC NULLS LAST
     """
-    display(spark.sql(high_io_wait_query))
-except Exception as e:
-    print(f"⚠️ Could not query I/O wait data: {e}")
+    sections.submit("high_io_wait", high_io_wait_query, max_rows=max_report_rows)
+else:
+    print("⚠️ Skipped - system.compute.node_timeline is not accessible (see Shared Data)")
 
 # COMMAND ----------
 
@@ -281,35 +448,8 @@ except Exception as e:
 # COMMAND ----------
 
 # High Memory Utilization Clusters
-try:
-    high_memory_query = f"""
-    WITH cluster_memory_stats AS (
-        SELECT 
-            nt.cluster_id,
-            ROUND(AVG(nt.mem_used_percent), 2) AS avg_memory_percent,
-            ROUND(MAX(nt.mem_used_percent), 2) AS max_memory_percent,
-            ROUND(AVG(nt.mem_swap_percent), 2) AS avg_swap_percent,
-            ROUND(MAX(nt.mem_swap_percent), 2) AS max_swap_percent
-        FROM system.compute.node_timeline nt
-        WHERE nt.start_time >= date_sub(current_date(), {lookback_days})
-            AND nt.driver = false
-        GROUP BY nt.cluster_id
-        HAVING AVG(nt.mem_used_percent) >= {memory_threshold} OR AVG(nt.mem_swap_percent) >= {swap_threshold}
-    ),
-    cluster_costs AS (
-        SELECT 
-            u.usage_metadata.cluster_id,
-            ROUND(SUM(u.usage_quantity), 2) AS total_dbus,
-            ROUND(SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)), 2) AS total_cost_usd
-        FROM system.billing.usage u
-        LEFT JOIN system.billing.list_prices lp 
-            ON u.sku_name = lp.sku_name
-            AND u.usage_start_time >= lp.price_start_time
-            AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-        WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-            AND u.usage_metadata.cluster_id IS NOT NULL
-        GROUP BY u.usage_metadata.cluster_id
-    )
+if has_node_timeline:
+    high_memory_query = """
     SELECT 
         c.account_id,
         c.workspace_id,
@@ -317,30 +457,26 @@ try:
         c.cluster_name,
         c.owned_by AS owner,
         c.dbr_version,
-        mem.avg_memory_percent,
-        mem.max_memory_percent,
-        mem.avg_swap_percent,
-        mem.max_swap_percent,
+        ROUND(c.avg_memory_percent, 2) AS avg_memory_percent,
+        ROUND(c.max_memory_percent, 2) AS max_memory_percent,
+        ROUND(c.avg_swap_percent, 2) AS avg_swap_percent,
+        ROUND(c.max_swap_percent, 2) AS max_swap_percent,
         c.driver_node_type,
         c.worker_node_type,
-        COALESCE(cc.total_dbus, 0) AS total_dbus,
-        COALESCE(cc.total_cost_usd, 0) AS total_cost_usd,
+        ROUND(COALESCE(c.total_dbus, 0), 2) AS total_dbus,
+        ROUND(COALESCE(c.total_cost_usd, 0), 2) AS total_cost_usd,
         CASE 
-            WHEN mem.avg_swap_percent >= {swap_threshold} THEN '🔴 SWAPPING - larger nodes, more workers'
-            WHEN mem.avg_memory_percent >= {memory_threshold} THEN '🟠 Memory-bound - larger nodes, more workers'
+            WHEN c.avg_swap_percent >= :swap_threshold THEN '🔴 SWAPPING - larger nodes, more workers'
+            WHEN c.avg_memory_percent >= :memory_threshold THEN '🟠 Memory-bound - larger nodes, more workers'
             ELSE '🟡 MODERATE - Monitor for memory pressure'
         END AS recommendation
-    FROM system.compute.clusters c
-    JOIN cluster_memory_stats mem ON c.cluster_id = mem.cluster_id
-    LEFT JOIN cluster_costs cc ON c.cluster_id = cc.cluster_id
-    WHERE c.delete_time IS NULL
-        AND c.change_time >= date_sub(current_date(), {lookback_days})
-        AND {workspace_clause}
-    ORDER BY cc.total_cost_usd DESC NULLS LAST
+    FROM cluster_utilization c
+    WHERE (c.avg_memory_percent >= :memory_threshold OR c.avg_swap_percent >= :swap_threshold)
+    ORDER BY c.total_cost_usd DESC NULLS LAST
     """
-    display(spark.sql(high_memory_query))
-except Exception as e:
-    print(f"⚠️ Could not query memory utilization data: {e}")
+    sections.submit("high_memory", high_memory_query, max_rows=max_report_rows)
+else:
+    print("⚠️ Skipped - system.compute.node_timeline is not accessible (see Shared Data)")
 
 # COMMAND ----------
 
@@ -356,55 +492,29 @@ except Exception as e:
 # COMMAND ----------
 
 # Resource Utilization Summary
-try:
-    resource_summary_query = f"""
-    WITH cluster_stats AS (
-        SELECT 
-            nt.cluster_id,
-            AVG(nt.cpu_user_percent + nt.cpu_system_percent) AS avg_cpu_percent,
-            AVG(nt.cpu_wait_percent) AS avg_io_wait_percent,
-            AVG(nt.mem_used_percent) AS avg_memory_percent,
-            AVG(nt.mem_swap_percent) AS avg_swap_percent
-        FROM system.compute.node_timeline nt
-        WHERE nt.start_time >= date_sub(current_date(), {lookback_days})
-            AND nt.driver = false
-        GROUP BY nt.cluster_id
-    ),
-    cluster_costs AS (
-        SELECT 
-            u.usage_metadata.cluster_id,
-            SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)) AS total_cost_usd
-        FROM system.billing.usage u
-        LEFT JOIN system.billing.list_prices lp 
-            ON u.sku_name = lp.sku_name
-            AND u.usage_start_time >= lp.price_start_time
-            AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
-        WHERE u.usage_start_time >= date_sub(current_date(), {lookback_days})
-            AND u.usage_metadata.cluster_id IS NOT NULL
-        GROUP BY u.usage_metadata.cluster_id
-    ),
-    categorized AS (
+if has_node_timeline:
+    resource_summary_query = """
+    WITH categorized AS (
         SELECT 
             c.cluster_id,
-            cs.avg_cpu_percent,
-            cs.avg_io_wait_percent,
-            cs.avg_memory_percent,
-            cs.avg_swap_percent,
-            cc.total_cost_usd,
+            c.avg_cpu_percent,
+            c.avg_io_wait_percent,
+            c.avg_memory_percent,
+            c.avg_swap_percent,
+            c.total_cost_usd,
             CASE 
-                WHEN cs.avg_swap_percent >= {swap_threshold} OR cs.avg_memory_percent >= {memory_threshold} THEN 'Memory-bound'
-                WHEN cs.avg_io_wait_percent >= {io_wait_threshold} THEN 'I/O-bound'
-                WHEN cs.avg_cpu_percent >= {cpu_threshold} THEN 'CPU-bound'
+                WHEN c.avg_swap_percent >= :swap_threshold OR c.avg_memory_percent >= :memory_threshold THEN 'Memory-bound'
+                WHEN c.avg_io_wait_percent >= :io_wait_threshold THEN 'I/O-bound'
+                WHEN c.avg_cpu_percent >= :cpu_threshold THEN 'CPU-bound'
                 ELSE 'Balanced/Underutilized'
             END AS bottleneck_type
-        FROM system.compute.clusters c
-        JOIN cluster_stats cs ON c.cluster_id = cs.cluster_id
-        LEFT JOIN cluster_costs cc ON c.cluster_id = cc.cluster_id
-        WHERE c.delete_time IS NULL
-            AND c.change_time >= date_sub(current_date(), {lookback_days})
-            AND {workspace_clause}
+        FROM cluster_utilization c
+    ),
+    grand_total AS (
+        SELECT COALESCE(SUM(total_cost_usd), 0) AS total_cost_usd
+        FROM categorized
     )
-    SELECT 
+    SELECT /*+ BROADCAST(gt) */
         bottleneck_type,
         CASE 
             WHEN bottleneck_type = 'CPU-bound' THEN '⚡ Enable Photon, compute-optimized, larger nodes, or more workers'
@@ -413,15 +523,89 @@ try:
             ELSE '✅ No immediate action needed'
         END AS recommendation,
         COUNT(*) AS cluster_count,
-        ROUND(SUM(COALESCE(total_cost_usd, 0)), 2) AS total_cost_usd,
-        ROUND(SUM(COALESCE(total_cost_usd, 0)) * 100.0 / NULLIF(SUM(SUM(COALESCE(total_cost_usd, 0))) OVER (), 0), 2) AS pct_of_total_cost
-    FROM categorized
-    GROUP BY bottleneck_type
+        ROUND(COALESCE(SUM(cat.total_cost_usd), 0), 2) AS total_cost_usd,
+        ROUND(COALESCE(SUM(cat.total_cost_usd), 0) * 100.0 / NULLIF(gt.total_cost_usd, 0), 2) AS pct_of_total_cost
+    FROM categorized cat
+    CROSS JOIN grand_total gt
+    GROUP BY bottleneck_type, gt.total_cost_usd
     ORDER BY total_cost_usd DESC
     """
-    display(spark.sql(resource_summary_query))
-except Exception as e:
-    print(f"⚠️ Could not query resource summary: {e}")
+    sections.submit("resource_summary", resource_summary_query, small_result=True)
+else:
+    print("⚠️ Skipped - system.compute.node_timeline is not accessible (see Shared Data)")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ---
+# MAGIC ## 📋 Analysis Results
+# MAGIC 
+# MAGIC The section queries above were submitted to run concurrently. Each cell below waits for its query to finish and displays the result.
+
+# COMMAND ----------
+
+# 🔥 High CPU Utilization Clusters
+if "high_cpu" in sections:
+    display(sections.result("high_cpu"))
+
+# COMMAND ----------
+
+# 💾 High I/O Wait Clusters
+if "high_io_wait" in sections:
+    display(sections.result("high_io_wait"))
+
+# COMMAND ----------
+
+# 🧠 High Memory Utilization Clusters
+if "high_memory" in sections:
+    display(sections.result("high_memory"))
+
+# COMMAND ----------
+
+# 📊 Resource Utilization Summary
+if "resource_summary" in sections:
+    display(sections.result("resource_summary"))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ---
+# MAGIC ## 💾 Save Results (Optional)
+# MAGIC 
+# MAGIC When **Save Results** is set to `Yes`, the cluster-level findings are appended to these tables in the output location:
+# MAGIC 
+# MAGIC | Table | Contents |
+# MAGIC |-------|----------|
+# MAGIC | `high_cpu_clusters` | CPU-bound clusters |
+# MAGIC | `high_io_wait_clusters` | I/O-bound clusters |
+# MAGIC | `high_memory_clusters` | Memory-bound clusters |
+# MAGIC 
+# MAGIC The tables are written by `save_results_table` in `Shared_Functions`, which describes their `analysis_date` column and Liquid Clustering layout.
+
+# COMMAND ----------
+
+if save_results:
+    try:
+        for section_name in ["high_cpu", "high_io_wait", "high_memory"]:
+            if section_name in sections:
+                # Re-run the full query (not the top-N display result) against the cached shared views
+                save_results_table(sections.build(sections.queries[section_name]), f"{section_name}_clusters", output_location)
+    except Exception as e:
+        print(f"Note: Could not save results to {output_location} - {e}")
+else:
+    print("Skipping save - set the 'Save Results' widget to 'Yes' to persist findings")
+
+# COMMAND ----------
+
+# Cleanup
+try:
+    sections.close()
+finally:
+    if has_node_timeline:
+        uncache_df(cluster_node_stats_df)
+        uncache_df(cluster_utilization_df)
+        uncache_df(cluster_costs_df)
+    uncache_df(active_clusters_df)
 
 # COMMAND ----------
 
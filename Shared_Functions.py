@@ -0,0 +1,250 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # 🧰 Shared Functions
+# MAGIC 
+# MAGIC Helpers used by both `Cluster_Optimization_Analysis` and `Resource_Utilization_Analysis`, which include this notebook with `%run ./Shared_Functions`. It only defines functions and settings - run one of the analysis notebooks instead.
+# MAGIC 
+# MAGIC With **Use Cache Tables** set to `Yes`, both notebooks read and write the same cache tables in the output location (`workspace_ids_cache`, `cluster_cost_daily`), so the queries and writers for those tables live here, in one place, and the two notebooks always write the same schema. With `No`, nothing is written and the system tables are queried directly.
+
+# COMMAND ----------
+
+import os
+from datetime import date, datetime, timedelta
+from pyspark.sql import functions as F
+
+# Small results are brought to the driver as Arrow batches instead of Row objects
+spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+
+# Serverless compute does not support persisting DataFrames; there the shared views are recomputed instead of cached
+is_serverless = os.environ.get("IS_SERVERLESS", "").upper() == "TRUE"
+
+def cache_df(df):
+    """Cache a DataFrame, unless running on serverless compute."""
+    return df if is_serverless else df.cache()
+
+def uncache_df(df):
+    """Release a DataFrame cached with cache_df."""
+    if not is_serverless:
+        df.unpersist()
+
+# COMMAND ----------
+
+# Workspace IDs for the Workspace Filter dropdown, cached in a Delta table in the output location
+workspace_cache_max_age_hours = 24
+
+workspace_ids_query = """
+    SELECT DISTINCT workspace_id
+    FROM system.compute.clusters
+    WHERE workspace_id IS NOT NULL
+"""
+
+def load_workspace_ids(output_location, use_cache_tables):
+    """Return workspace IDs from the Delta cache table, rebuilding it once it is older than a day."""
+    if not use_cache_tables:
+        return spark.sql(f"{workspace_ids_query} ORDER BY workspace_id").toPandas()["workspace_id"].tolist()
+
+    workspace_cache_table = f"{output_location}.workspace_ids_cache"
+    try:
+        last_modified = spark.sql(f"DESCRIBE DETAIL {workspace_cache_table}").first()["lastModified"]
+        is_stale = (datetime.now() - last_modified).total_seconds() > workspace_cache_max_age_hours * 3600
+    except Exception:
+        is_stale = True  # Cache table does not exist yet
+
+    if is_stale:
+        try:
+            spark.sql(f"CREATE OR REPLACE TABLE {workspace_cache_table} AS {workspace_ids_query}")
+        except Exception:
+            # No write access to the output location - fall back to the system table
+            return spark.sql(f"{workspace_ids_query} ORDER BY workspace_id").toPandas()["workspace_id"].tolist()
+
+    return spark.table(workspace_cache_table).orderBy("workspace_id").toPandas()["workspace_id"].tolist()
+
+# COMMAND ----------
+
+# Daily rollup tables in the output location (cluster_cost_daily here, cluster_node_daily in Resource_Utilization_Analysis)
+def optimize_table(table_name):
+    """Incrementally OPTIMIZE a liquid-clustered table; best effort, since the data is already written."""
+    try:
+        spark.sql(f"OPTIMIZE {table_name}")
+    except Exception as e:
+        print(f"Note: Could not optimize {table_name} - {e}")
+
+def refresh_daily_table(table_name, daily_query, date_column, max_lookback_days, restate_days):
+    """Bring a daily rollup table up to date, recomputing only the days since the last refresh.
+
+    daily_query is grouped by date_column and cluster_id and reads rows from :refresh_from on.
+    The table is created on its first refresh, liquid-clustered on those two columns (the
+    lookback date filter and the per-cluster grouping key); later refreshes replace the
+    recent days in place.
+    """
+    if not spark.catalog.tableExists(table_name):
+        refresh_from = date.today() - timedelta(days=max_lookback_days)
+        spark.sql(daily_query, args={"refresh_from": refresh_from}).createOrReplaceTempView("daily_rows_to_save")
+        spark.sql(f"""
+            CREATE TABLE IF NOT EXISTS {table_name}
+            CLUSTER BY ({date_column}, cluster_id)
+            AS SELECT * FROM daily_rows_to_save
+        """)
+    else:
+        last_date = spark.table(table_name).agg(F.max(date_column)).first()[0]
+        if last_date is None:
+            refresh_from = date.today() - timedelta(days=max_lookback_days)
+        else:
+            refresh_from = last_date - timedelta(days=restate_days)
+        (
+            spark.sql(daily_query, args={"refresh_from": refresh_from}).write
+            .mode("overwrite")
+            .option("replaceWhere", f"{date_column} >= '{refresh_from}'")
+            .saveAsTable(table_name)
+        )
+    optimize_table(table_name)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ### 💾 Saved Results
+# MAGIC 
+# MAGIC With **Save Results** set to `Yes`, each notebook appends its cluster-level findings to Delta tables in the output location with an `analysis_date` column, so results can be tracked across runs. The tables use **Liquid Clustering** on `(workspace_id, cluster_id, analysis_date)` with optimized writes / auto compaction enabled, and are incrementally `OPTIMIZE`d after each append. Trend queries that filter by workspace, look up a cluster's history, or select a date range skip unrelated files.
+
+# COMMAND ----------
+
+def save_results_table(df, table_name, output_location):
+    """Append a findings DataFrame to a liquid-clustered Delta table in the output location."""
+    target_table = f"{output_location}.{table_name}"
+    df.withColumn("analysis_date", F.current_date()).createOrReplaceTempView("results_to_save")
+
+    if spark.catalog.tableExists(target_table):
+        spark.sql(f"INSERT INTO {target_table} BY NAME SELECT * FROM results_to_save")
+        # Incremental for liquid clustering - only clusters the newly appended files
+        optimize_table(target_table)
+    else:
+        spark.sql(f"""
+            CREATE TABLE {target_table}
+            CLUSTER BY (workspace_id, cluster_id, analysis_date)
+            TBLPROPERTIES (
+                'delta.autoOptimize.optimizeWrite' = 'true',
+                'delta.autoOptimize.autoCompact' = 'true'
+            )
+            AS SELECT * FROM results_to_save
+        """)
+    print(f"✅ Saved results to {target_table}")
+
+# COMMAND ----------
+
+# Daily per-cluster DBUs and cost, kept in a Delta table so each run only re-aggregates the latest days of billing data
+cluster_cost_max_lookback_days = 180  # Longest lookback offered by the widgets
+cluster_cost_restate_days = 3         # Recent days are recomputed to pick up late-arriving billing records
+
+cluster_cost_daily_query = """
+    WITH usage_in_window AS (
+        -- Filter on usage_date (the table's date partition column) and project before the price join
+        SELECT
+            usage_metadata.cluster_id AS cluster_id,
+            usage_date,
+            sku_name,
+            usage_start_time,
+            usage_quantity
+        FROM system.billing.usage
+        WHERE usage_date >= :refresh_from
+            AND usage_metadata.cluster_id IS NOT NULL
+    )
+    SELECT /*+ BROADCAST(lp) */
+        u.cluster_id,
+        u.usage_date,
+        SUM(u.usage_quantity) AS dbus,
+        SUM(u.usage_quantity * COALESCE(lp.pricing.default, 0)) AS cost_usd
+    FROM usage_in_window u
+    LEFT JOIN system.billing.list_prices lp
+        ON u.sku_name = lp.sku_name
+        AND u.usage_start_time >= lp.price_start_time
+        AND (lp.price_end_time IS NULL OR u.usage_start_time < lp.price_end_time)
+    GROUP BY u.cluster_id, u.usage_date
+"""
+
+def load_cluster_costs(cluster_cost_daily_table, lookback_start_date, use_cache_tables):
+    """Return total DBUs and cost per cluster since lookback_start_date.
+
+    With use_cache_tables, summed from the daily cost table after refreshing it. Otherwise,
+    or without write access to the output location, the same daily query runs over the
+    lookback period instead.
+    """
+    daily_costs_df = None
+    if use_cache_tables:
+        try:
+            refresh_daily_table(
+                cluster_cost_daily_table, cluster_cost_daily_query, "usage_date",
+                cluster_cost_max_lookback_days, cluster_cost_restate_days,
+            )
+            daily_costs_df = spark.table(cluster_cost_daily_table).where(F.col("usage_date") >= F.lit(lookback_start_date))
+        except Exception as e:
+            print(f"Note: Could not refresh {cluster_cost_daily_table}, reading system.billing.usage directly - {e}")
+    if daily_costs_df is None:
+        daily_costs_df = spark.sql(cluster_cost_daily_query, args={"refresh_from": lookback_start_date})
+    return daily_costs_df.groupBy("cluster_id").agg(
+        F.sum("dbus").alias("total_dbus"),
+        F.sum("cost_usd").alias("total_cost_usd"),
+    )
+
+# COMMAND ----------
+
+# Section queries run concurrently - each notebook creates one SectionQueries with its own parameters and pool size
+from concurrent.futures import ThreadPoolExecutor
+
+class SectionQueries:
+    """The section queries of one notebook run, executed in the background on a thread pool.
+
+    Each query is parsed on the notebook thread with the notebook's query parameters, and its
+    result is fetched by section name in the Analysis Results cells.
+    """
+
+    def __init__(self, query_params, max_workers):
+        self.query_params = query_params
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = {}
+        self.queries = {}
+
+    def __contains__(self, name):
+        return name in self.futures
+
+    def build(self, query):
+        """Parse and analyze a section query on the notebook thread, binding the query parameters."""
+        return spark.sql(query, args=self.query_params)
+
+    def submit(self, name, query, small_result=False, max_rows=None):
+        """Start a section query in the background; its result is displayed in Analysis Results.
+
+        With max_rows, only the top rows of the (ordered) query are computed for display.
+        """
+        self.queries[name] = query
+        # Building the DataFrame here surfaces SQL errors in the cell that defines the query
+        section_df = self.build(query)
+        if max_rows is not None:
+            section_df = section_df.limit(max_rows)
+        self.futures[name] = self.pool.submit(run_section_query, section_df, small_result)
+        print(f"⏳ Submitted query: {name}")
+
+    def result(self, name):
+        """Wait for a section query and return its result."""
+        return self.futures[name].result()
+
+    def close(self):
+        """Release the cached results of the sections that succeeded and shut down the pool."""
+        try:
+            for future in self.futures.values():
+                if future.exception() is None and hasattr(future.result(), "unpersist"):
+                    uncache_df(future.result())
+        finally:
+            self.pool.shutdown()
+
+def run_section_query(section_df, small_result):
+    """Execute an analyzed section DataFrame.
+
+    Small summaries are returned as pandas DataFrames; cluster-level results stay
+    distributed and are cached for display (on serverless compute they are computed
+    when displayed).
+    """
+    if small_result:
+        return section_df.toPandas()
+    if not is_serverless:
+        section_df.cache().count()
+    return section_df